@@ -35,6 +35,14 @@ async function createVideosTable() {
     ALTER TABLE videos ADD COLUMN IF NOT EXISTS logs TEXT[] DEFAULT '{}';
     ALTER TABLE videos ADD COLUMN IF NOT EXISTS author_name TEXT;
     ALTER TABLE videos ADD COLUMN IF NOT EXISTS hidden BOOLEAN DEFAULT FALSE;
+    ALTER TABLE videos ADD COLUMN IF NOT EXISTS preview_url TEXT;
+    ALTER TABLE videos ADD COLUMN IF NOT EXISTS sprite_url TEXT;
+    CREATE TABLE IF NOT EXISTS job_logs (
+      job_id UUID NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+      seq BIGSERIAL,
+      line TEXT NOT NULL,
+      PRIMARY KEY (job_id, seq)
+    );
   `;
 
   try {
@@ -94,7 +102,7 @@ async function updateJobStatus(id, status, videoUrl = null, thumbnailUrl = null)
 //gets a single job by its id
 async function getJobById(id){
   const query = `
-    SELECT id, prompt, title, author_name, style, status, video_url, thumbnail_url, created_at
+    SELECT id, prompt, title, author_name, style, status, video_url, thumbnail_url, preview_url, sprite_url, created_at
     FROM videos
     WHERE id = $1;
   `;
@@ -128,7 +136,7 @@ async function getRecentCompletedVideos(search = null, includeHidden = false) {
   }
 
   const query = `
-    SELECT id, COALESCE(title, prompt) AS display_title, prompt, title, author_name, style, video_url, thumbnail_url, created_at, COALESCE(hidden, FALSE) AS hidden
+    SELECT id, COALESCE(title, prompt) AS display_title, prompt, title, author_name, style, video_url, thumbnail_url, preview_url, sprite_url, created_at, COALESCE(hidden, FALSE) AS hidden
     FROM videos
     ${whereClause}
     ORDER BY created_at DESC;
@@ -214,30 +222,44 @@ async function setVideoHidden(id, hidden) {
   }
 }
 
-//appends a log line to a job's logs array
+//appends a log line to the job_logs table (append-only, never rewrites the videos row)
 async function appendJobLog(id, message) {
   const query = `
-    UPDATE videos
-    SET logs = array_append(logs, $1)
-    WHERE id = $2;
+    INSERT INTO job_logs (job_id, line)
+    VALUES ($1, $2);
   `;
   try {
-    await pool.query(query, [`[${new Date().toISOString()}] ${message}`, id]);
+    await pool.query(query, [id, `[${new Date().toISOString()}] ${message}`]);
   } catch (error) {
     console.error('Error appending log:', error.message);
   }
 }
 
-//gets the logs array for a job
-async function getJobLogs(id) {
-  const query = `SELECT logs FROM videos WHERE id = $1;`;
+//gets the log lines for a job after the given cursor (seq), so pollers only fetch new lines
+//jobs from before the job_logs migration fall back to the legacy videos.logs array
+async function getJobLogs(id, after = 0) {
+  const query = `
+    SELECT seq, line
+    FROM job_logs
+    WHERE job_id = $1 AND seq > $2
+    ORDER BY seq;
+  `;
   try {
-    const result = await pool.query(query, [id]);
-    if (result.rows.length === 0) return [];
-    return result.rows[0].logs || [];
+    const result = await pool.query(query, [id, after]);
+    if (result.rows.length > 0) {
+      return {
+        logs: result.rows.map((row) => row.line),
+        cursor: Number(result.rows[result.rows.length - 1].seq)
+      };
+    }
+    if (after > 0) return { logs: [], cursor: after };
+
+    const legacy = await pool.query(`SELECT logs FROM videos WHERE id = $1;`, [id]);
+    const logs = legacy.rows.length > 0 ? (legacy.rows[0].logs || []) : [];
+    return { logs, cursor: 0 };
   } catch (error) {
     console.error('Error getting logs:', error.message);
-    return [];
+    return { logs: [], cursor: after };
   }
 }
 
@@ -6,6 +6,9 @@ const db = require('./database');
 const app = express();
 const PORT = process.env.PORT || 3000;
 
+// behind the platform's proxy, req.ip is the client address from X-Forwarded-For (quota and
+// fair-intake flows are keyed on it); TRUST_PROXY is the number of proxy hops in front of us
+app.set('trust proxy', parseInt(process.env.TRUST_PROXY || '1', 10));
 app.use(express.json());
 app.use(cors());
 //log all incoming requests
@@ -0,0 +1,29 @@
+-- Move pipeline logs out of the hot videos row into an append-only child table.
+-- Safe to run more than once. createVideosTable() creates the table for fresh installs;
+-- this file additionally backfills lines from the legacy videos.logs array.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS job_logs (
+  job_id UUID NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+  seq BIGSERIAL,
+  line TEXT NOT NULL,
+  PRIMARY KEY (job_id, seq)
+);
+
+-- copy legacy arrays in their original order, skipping jobs that already have rows
+INSERT INTO job_logs (job_id, line)
+SELECT v.id, l.line
+FROM videos v
+CROSS JOIN LATERAL unnest(v.logs) WITH ORDINALITY AS l(line, ord)
+WHERE cardinality(v.logs) > 0
+  AND NOT EXISTS (SELECT 1 FROM job_logs j WHERE j.job_id = v.id)
+ORDER BY v.created_at, v.id, l.ord;
+
+-- release the array storage (and its TOAST) from the rows the feed reads
+UPDATE videos SET logs = '{}' WHERE cardinality(logs) > 0;
+
+COMMIT;
+
+-- VACUUM cannot run inside a transaction; reclaim the dead tuples afterwards
+VACUUM (ANALYZE) videos;
@@ -0,0 +1,7 @@
+-- Animated preview (previews/<id>.webp) and scrub sprite (sprites/<id>.jpg) URLs written by the
+-- worker on completion, so the feed can show the light assets instead of the full MP4.
+-- Safe to run more than once; createVideosTable() adds the same columns on fresh installs.
+-- Videos finished before this migration keep NULLs (their derivatives were uploaded but not recorded).
+
+ALTER TABLE videos ADD COLUMN IF NOT EXISTS preview_url TEXT;
+ALTER TABLE videos ADD COLUMN IF NOT EXISTS sprite_url TEXT;
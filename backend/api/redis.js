@@ -20,12 +20,36 @@ client.connect().catch((err) => {
   process.exit(1);
 });
 
+// with FAIR_INTAKE=1 jobs go to per-client intake queues instead of straight onto the celery list;
+// the worker's intake dispatcher (backend/worker/intake.py) hands them to Celery with weighted
+// fair queuing across clients (and tiers), so one client's burst can't sit in front of everyone else
+const FAIR_INTAKE = process.env.FAIR_INTAKE === '1';
+const INTAKE_FLOWS_KEY = 'keyframe:intake:flows';
+
+function intakeQueueKey(tier, user) {
+  return `keyframe:intake:${tier}:${user}`;
+}
+
+//helper function to push a job to a user's intake queue
+async function pushIntakeJob(jobData, { user, tier }) {
+  const flow = `${tier}:${user}`;
+  const entry = JSON.stringify({ ...jobData, user, tier, enqueued_at: Date.now() / 1000 });
+  await client.multi()
+    .lPush(intakeQueueKey(tier, user), entry)
+    .sAdd(INTAKE_FLOWS_KEY, flow)
+    .exec();
+  console.log(`Job pushed to intake queue ${flow}:`, jobData.id);
+}
+
 //helper function to push a job to the queue in celery format
-async function pushJob(jobData) {
+async function pushJob(jobData, { user = '', tier = 'standard' } = {}) {
   try {
+    if (FAIR_INTAKE) {
+      return await pushIntakeJob(jobData, { user: user || 'anonymous', tier });
+    }
      const taskId =uuidv4();
     const celeryMessage= {
-      body: Buffer.from(JSON.stringify([[jobData], {}, {}])).toString('base64'),
+      body: Buffer.from(JSON.stringify([[{ ...jobData, user, tier, enqueued_at: Date.now() / 1000 }], {}, {}])).toString('base64'),
       'content-encoding': 'utf-8',
       'content-type': 'application/json',
       headers: {
@@ -2,7 +2,7 @@ const express = require('express');
 const router = express.Router();
 const db = require('../database');
 const redis = require('../redis');
-const { DAILY_LIMIT, USER_DAILY_LIMIT, todayKey, userKey, secondsUntilMidnightUTC } = require('./quota');
+const { DAILY_LIMIT, USER_DAILY_LIMIT, todayKey, userKey, quotaIdentity, secondsUntilMidnightUTC } = require('./quota');
 
 //POST /api/v1/generate
 router.post('/', async (req,res) =>{
@@ -21,27 +21,25 @@ router.post('/', async (req,res) =>{
       });
     }
 
-    const userToken = req.headers['x-user-token'] || '';
+    const userToken = quotaIdentity(req);
 
-    // check per-user daily quota (2/day per browser UUID)
-    if (userToken) {
-      try {
-        const uKey = userKey(userToken);
-        const userCount = await redis.client.incr(uKey);
-        if (userCount === 1) {
-          await redis.client.expire(uKey, secondsUntilMidnightUTC() + 60);
-        }
-        if (userCount > USER_DAILY_LIMIT) {
-          await redis.client.decr(uKey);
-          return res.status(429).json({
-            error: `You've reached your daily limit of ${USER_DAILY_LIMIT} videos. Check back tomorrow!`,
-            userRemaining: 0,
-            resetsInSeconds: secondsUntilMidnightUTC()
-          });
-        }
-      } catch (quotaErr) {
-        console.error('User quota Redis error (failing open):', quotaErr.message);
+    // check per-user daily quota (2/day per browser UUID, or per IP without one)
+    try {
+      const uKey = userKey(userToken);
+      const userCount = await redis.client.incr(uKey);
+      if (userCount === 1) {
+        await redis.client.expire(uKey, secondsUntilMidnightUTC() + 60);
       }
+      if (userCount > USER_DAILY_LIMIT) {
+        await redis.client.decr(uKey);
+        return res.status(429).json({
+          error: `You've reached your daily limit of ${USER_DAILY_LIMIT} videos. Check back tomorrow!`,
+          userRemaining: 0,
+          resetsInSeconds: secondsUntilMidnightUTC()
+        });
+      }
+    } catch (quotaErr) {
+      console.error('User quota Redis error (failing open):', quotaErr.message);
     }
 
     // check global daily quota
@@ -53,10 +51,8 @@ router.post('/', async (req,res) =>{
       }
       if (count > DAILY_LIMIT) {
         await redis.client.decr(key);
-        // also roll back user count if we had incremented it
-        if (userToken) {
-          await redis.client.decr(userKey(userToken)).catch(() => {});
-        }
+        // also roll back the user count we incremented
+        await redis.client.decr(userKey(userToken)).catch(() => {});
         return res.status(429).json({
           error: `Daily generation limit of ${DAILY_LIMIT} reached. Check back tomorrow.`,
           remaining: 0,
@@ -77,7 +73,12 @@ router.post('/', async (req,res) =>{
       prompt: prompt,
       style: resolvedStyle
     };
-    await redis.pushJob(jobData);
+    // one fair-queuing flow per client IP: the x-user-token header is whatever the client
+    // sends, so it can't decide whose share a job comes out of
+    await redis.pushJob(jobData, {
+      user: req.ip,
+      tier: 'standard'
+    });
     
 
     res.status(202).json({
@@ -13,6 +13,11 @@ function userKey(token) {
   return `quota:user:${new Date().toISOString().slice(0, 10)}:${token}`;
 }
 
+// the per-user quota follows the browser UUID, or the client IP for requests without one
+function quotaIdentity(req) {
+  return req.headers['x-user-token'] || `ip:${req.ip}`;
+}
+
 function secondsUntilMidnightUTC() {
   const now = new Date();
   const midnight = new Date(Date.UTC(now.getUTCFullYear(), now.getUTCMonth(), now.getUTCDate() + 1));
@@ -22,10 +27,10 @@ function secondsUntilMidnightUTC() {
 // GET /api/v1/quota
 router.get('/', async (req, res) => {
   try {
-    const token = req.headers['x-user-token'] || '';
+    const token = quotaIdentity(req);
     const [globalUsed, userUsed] = await Promise.all([
       redis.get(todayKey()).then(v => parseInt(v || '0', 10)),
-      token ? redis.get(userKey(token)).then(v => parseInt(v || '0', 10)) : Promise.resolve(0),
+      redis.get(userKey(token)).then(v => parseInt(v || '0', 10)),
     ]);
     res.json({
       used: globalUsed,
@@ -42,4 +47,4 @@ router.get('/', async (req, res) => {
   }
 });
 
-module.exports = { router, DAILY_LIMIT, USER_DAILY_LIMIT, todayKey, userKey, secondsUntilMidnightUTC };
+module.exports = { router, DAILY_LIMIT, USER_DAILY_LIMIT, todayKey, userKey, quotaIdentity, secondsUntilMidnightUTC };
@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const db = require('../database');
+const redis = require('../redis');
 const { isBlocked } = require('../moderation');
 
 router.get('/:id',async(req, res) => {
@@ -30,6 +31,8 @@ router.get('/:id',async(req, res) => {
       status: job.status,
       video_url: job.video_url,
       thumbnail_url: job.thumbnail_url,
+      preview_url: job.preview_url || null,
+      sprite_url: job.sprite_url || null,
       created_at: job.created_at
     });
     
@@ -41,18 +44,38 @@ router.get('/:id',async(req, res) => {
   }
 });
 
-// GET /api/v1/status/:id/logs — return the pipeline log lines for a job
+// GET /api/v1/status/:id/logs?after=<cursor> — return the pipeline log lines after the cursor
 router.get('/:id/logs', async (req, res) => {
   try {
     const { id } = req.params;
-    const logs = await db.getJobLogs(id);
-    res.json({ logs });
+    const after = parseInt(req.query.after, 10) || 0;
+    const { logs, cursor } = await db.getJobLogs(id, after);
+    res.json({ logs, cursor });
   } catch (error) {
     console.error('Error in logs route:', error);
     res.status(500).json({ error: 'Failed to get logs' });
   }
 });
 
+// GET /api/v1/status/:id/events?after=<stream id> — status/log events the worker published to
+// Redis after the given id, so clients can follow a job without polling Postgres
+router.get('/:id/events', async (req, res) => {
+  try {
+    const { id } = req.params;
+    const after = req.query.after;
+    const start = after ? `(${after}` : '-';
+    const entries = await redis.client.xRange(`keyframe:job:${id}:events`, start, '+', { COUNT: 500 });
+    const events = entries.map((entry) => ({ id: entry.id, ...entry.message }));
+    res.json({
+      events,
+      cursor: events.length ? events[events.length - 1].id : (after || null)
+    });
+  } catch (error) {
+    console.error('Error in events route:', error);
+    res.status(500).json({ error: 'Failed to get events' });
+  }
+});
+
 // PATCH /api/v1/status/:id/title — save video title from the done screen
 router.patch('/:id/title', async (req, res) => {
   try {
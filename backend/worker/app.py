@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
 from celery import Celery
+from celery.signals import worker_ready
 import ssl
 
 load_dotenv()
@@ -19,6 +20,11 @@ app = Celery(
     backend=redis_url,
 )
 
+# pipeline stage queues (PIPELINE_MODE=chain): API-bound stages go to the I/O queue, FFmpeg
+# assembly to the CPU queue, so each can be consumed by differently sized workers
+STAGE_IO_QUEUE = os.getenv('STAGE_IO_QUEUE', 'keyframe.io')
+STAGE_CPU_QUEUE = os.getenv('STAGE_CPU_QUEUE', 'keyframe.cpu')
+
 # celery configuration
 app.conf.update(
     task_serializer='json',
@@ -27,6 +33,27 @@ app.conf.update(
     timezone='UTC',
     enable_utc=True,
     task_time_limit=300,
+    # a stage that overruns gets SoftTimeLimitExceeded first and retries from its checkpoint;
+    # the threads pool enforces neither limit, so inline jobs also check it between stages
+    task_soft_time_limit=int(os.getenv('TASK_SOFT_TIME_LIMIT', '280')),
+    # ack only once a task finishes, so a killed worker's job is redelivered and resumes
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # Redis redelivers an unacked task after visibility_timeout (1h by default), which is also how
+    # long a hard-killed worker's job waits before it resumes. Kept short: a copy redelivered while
+    # the job is still running waits on the job's lease (see checkpoint.py) instead of running
+    # alongside it. It must stay above JOB_LOCK_TTL, the countdown of those lease retries.
+    broker_transport_options={'visibility_timeout': int(os.getenv('BROKER_VISIBILITY_TIMEOUT', '600'))},
+    # one job at a time per execution slot: with --pool threads a single process drives
+    # WORKER_CONCURRENCY jobs, so don't let it reserve more than it is about to start
+    worker_prefetch_multiplier=1,
+    task_routes={
+        'orchestrator.stage_director': {'queue': STAGE_IO_QUEUE},
+        'orchestrator.stage_assets': {'queue': STAGE_IO_QUEUE},
+        'orchestrator.stage_audit': {'queue': STAGE_IO_QUEUE},
+        'orchestrator.stage_assemble': {'queue': STAGE_CPU_QUEUE},
+        'orchestrator.stage_upload': {'queue': STAGE_IO_QUEUE},
+    },
     worker_log_format='[%(asctime)s: %(levelname)s/%(processName)s] %(message)s',
     worker_task_log_format='[%(asctime)s: %(levelname)s/%(processName)s] [%(task_name)s(%(task_id)s)] %(message)s',  
     imports=(
@@ -35,5 +62,12 @@ app.conf.update(
 )
 
 
+# serve /metrics from the worker process once it is up (see metrics.py)
+@worker_ready.connect
+def start_metrics(**kwargs):
+    import metrics
+    metrics.start()
+
+
 if __name__ == '__main__':
     app.start()
\ No newline at end of file
@@ -2,40 +2,266 @@
 import os
 import subprocess
 import tempfile
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from disk_cache import DiskCache, hash_key, hash_file
+import metrics
 
 def _ffmpeg():
     return os.getenv('FFMPEG_PATH') or os.path.abspath(
         os.path.join(os.path.dirname(__file__), '..', '..', 'bin', 'ffmpeg.exe')
     )
 
+# upper bound on any single FFmpeg run; the threads pool enforces no task time limit, so a hung
+# encode would otherwise hold its execution slot forever
+FFMPEG_TIMEOUT = float(os.getenv('FFMPEG_TIMEOUT', '180'))
+
+SEGMENT_VF = 'scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:(ow-iw)/2:(oh-ih)/2,setsar=1'
+
+def encode_threads():
+    """libx264 threads per segment encode (ENCODE_THREADS, default 2)"""
+    try:
+        return max(1, int(os.getenv('ENCODE_THREADS', '2')))
+    except ValueError:
+        return 2
+
+def segment_workers():
+    """Concurrent segment encodes (SEGMENT_WORKERS, default cores / threads per encode)"""
+    try:
+        configured = int(os.getenv('SEGMENT_WORKERS', '0'))
+    except ValueError:
+        configured = 0
+    if configured > 0:
+        return configured
+    return max(1, (os.cpu_count() or 1) // encode_threads())
+
+def assembly_concurrency():
+    """Jobs allowed in stitch_video at once per worker process (ASSEMBLY_CONCURRENCY, default
+    how many full-width segment pools fit on this machine — usually 1)"""
+    try:
+        configured = int(os.getenv('ASSEMBLY_CONCURRENCY', '0'))
+    except ValueError:
+        configured = 0
+    if configured > 0:
+        return configured
+    return max(1, (os.cpu_count() or 1) // (segment_workers() * encode_threads()))
+
+# process-wide encode capacity, shared by every job this worker drives (--pool threads):
+# encode slots bound concurrent libx264 segment encodes (scheduler and assembly alike),
+# assembly slots bound how many jobs run the stitch stage at once
+encode_slots = threading.BoundedSemaphore(segment_workers())
+assembly_slots = threading.BoundedSemaphore(assembly_concurrency())
+
+SEGMENT_CODEC_ARGS = ['-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '28', '-pix_fmt', 'yuv420p', '-r', '30']
+
+# segments are a pure function of (image bytes, duration, filter, codec settings), so identical
+# encodes from auditor retries, re-renders and duplicate jobs are served from disk
+segment_cache = DiskCache(
+    'segment',
+    os.getenv('SEGMENT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'keyframe_segment_cache'),
+    int(float(os.getenv('SEGMENT_CACHE_MAX_MB', '2048')) * 1024 * 1024),
+)
+
+def segment_cache_key(image_path, duration):
+    return hash_key(hash_file(image_path), f'{float(duration):.3f}', SEGMENT_VF, ' '.join(SEGMENT_CODEC_ARGS))
+
+def encode_segment(image_path, duration, segment_path):
+    """Encode one still image into a silent MP4 segment of the given duration"""
+    return _encode_segment(image_path, duration, segment_path)[0]
+
+def _encode_segment(image_path, duration, segment_path):
+    """encode_segment that also reports whether the segment came from the cache: (path, hit)"""
+    key = segment_cache_key(image_path, duration) if segment_cache.enabled else None
+    if key and segment_cache.fetch(key, '.mp4', segment_path):
+        print(f"Segment cache hit for {os.path.basename(segment_path)}")
+        return segment_path, True
+
+    cmd = [
+        _ffmpeg(), '-y',
+        '-loop', '1', '-framerate', '30', '-t', str(duration), '-i', image_path,
+        '-vf', SEGMENT_VF,
+        *SEGMENT_CODEC_ARGS,
+        '-threads', str(encode_threads()),
+        '-an',
+        segment_path
+    ]
+    with encode_slots, metrics.ffmpeg('segment'):
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=FFMPEG_TIMEOUT)
+    if result.returncode != 0:
+        raise Exception(f"FFmpeg segment {os.path.basename(segment_path)} failed: {result.stderr[-500:]}")
+    if key:
+        segment_cache.put(key, '.mp4', segment_path)
+    return segment_path, False
+
+class EncodeSlotsBusy(Exception):
+    pass
+
+class PipedSegmentEncoder:
+    """Segment encoder that is started before its image exists and is fed the JPEG bytes
+    over stdin while they download, so the encode finishes right after the last chunk.
+    It holds an encode slot from start to finish/abort; raises EncodeSlotsBusy if none is free
+    (callers then encode from the file once it exists, which waits for a slot)"""
+
+    def __init__(self, duration, segment_path):
+        self.segment_path = segment_path
+        if not encode_slots.acquire(blocking=False):
+            raise EncodeSlotsBusy('no free encode slot')
+        self._holds_slot = True
+        try:
+            self._start(duration, segment_path)
+        except Exception:
+            self._release()
+            raise
+
+    def _release(self):
+        if self._holds_slot:
+            self._holds_slot = False
+            encode_slots.release()
+
+    def _start(self, duration, segment_path):
+        self._stderr = tempfile.TemporaryFile()
+        cmd = [
+            _ffmpeg(), '-y', '-loglevel', 'error',
+            '-f', 'image2pipe', '-framerate', '30', '-i', 'pipe:0',
+            '-vf', f'loop=loop=-1:size=1:start=0,{SEGMENT_VF}',
+            '-t', str(duration),
+            *SEGMENT_CODEC_ARGS,
+            '-threads', str(encode_threads()),
+            '-an',
+            segment_path
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr)
+        self._started = time.perf_counter()
+
+    def write(self, chunk):
+        self.proc.stdin.write(chunk)
+
+    def abort(self):
+        try:
+            self.proc.kill()
+        except OSError:
+            pass
+        self.proc.wait()
+        self._stderr.close()
+        self._release()
+
+    def finish(self):
+        """Close stdin and wait for FFmpeg; returns the segment path or raises"""
+        try:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+            try:
+                returncode = self.proc.wait(timeout=FFMPEG_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+                raise Exception(f"FFmpeg piped segment {os.path.basename(self.segment_path)} timed out after {FFMPEG_TIMEOUT:.0f}s")
+            finally:
+                metrics.observe_ffmpeg('segment_piped', time.perf_counter() - self._started)
+        finally:
+            self._release()
+        self._stderr.seek(0)
+        stderr = self._stderr.read().decode('utf-8', 'replace')
+        self._stderr.close()
+        if returncode != 0:
+            raise Exception(f"FFmpeg piped segment {os.path.basename(self.segment_path)} failed: {stderr[-500:]}")
+        return self.segment_path
+
+# assembly engines: 'segments' encodes one MP4 per slide then concat+mux (default, fallback),
+# 'filtergraph' builds the whole video in a single FFmpeg call with no intermediate files
+ENGINES = ('segments', 'filtergraph')
+
+def assembly_engine():
+    engine = os.getenv('ASSEMBLY_ENGINE', 'segments').strip().lower()
+    if engine not in ENGINES:
+        print(f"Unknown ASSEMBLY_ENGINE={engine!r}, using 'segments'")
+        return 'segments'
+    return engine
+
 # use images and audio files to stitch into one video
-def stitch_video(image_paths, audio_path, timings, job_id, temp_dir):
+def stitch_video(image_paths, audio_path, timings, job_id, temp_dir, segment_paths=None, engine=None, log=None):
 
     os.makedirs(temp_dir, exist_ok=True)
     output_path = os.path.join(temp_dir, f'final_video{job_id}.mp4')
+    engine = engine or assembly_engine()
+
+    print(f"Stitching video with {len(image_paths)} images and audio (engine={engine})...\n\n")
+
+    # other jobs in this worker may be assembling; wait for a slot rather than oversubscribing the CPU
+    waited = time.perf_counter()
+    with assembly_slots:
+        waited = time.perf_counter() - waited
+        if waited > 0.1:
+            print(f"Waited {waited:.2f}s for an assembly slot")
+            if log:
+                log(f'Editor: waited {waited:.1f}s for an assembly slot (other jobs encoding).')
 
-    print(f"Stitching video with {len(image_paths)} images and audio...\n\n")
+        if engine == 'filtergraph':
+            try:
+                _stitch_filtergraph(image_paths, audio_path, timings, output_path)
+            except Exception as e:
+                print(f"Filtergraph assembly failed ({e}), falling back to segment assembly")
+                _stitch_segments(image_paths, audio_path, timings, temp_dir, output_path, segment_paths, log)
+        else:
+            _stitch_segments(image_paths, audio_path, timings, temp_dir, output_path, segment_paths, log)
 
+    print(f"3. FFmpeg completed successfully")
+
+    if not os.path.exists(output_path):
+        raise Exception("FFmpeg completed but output file was not created")
+
+    file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
+    print(f"Video created: {output_path} ({file_size_mb:.2f} MB)")
+
+    return output_path
+
+
+def _stitch_segments(image_paths, audio_path, timings, temp_dir, output_path, segment_paths=None, log=None):
     FFMPEG_PATH = _ffmpeg()
 
-    # Step 1: create a silent MP4 segment per slide (one image at a time — low memory)
-    segment_paths = []
+    # Step 1: create a silent MP4 segment per slide on a bounded pool; results are written
+    # back by index so the concat list stays in slide order.
+    # segments already encoded by the orchestrator's slide scheduler are reused as-is
+    segment_paths = list(segment_paths or [None] * len(image_paths))
+    pending = []
     for i, (image_path, duration) in enumerate(zip(image_paths, timings)):
-        segment_path = os.path.join(temp_dir, f'segment_{i}.mp4')
-        cmd = [
-            FFMPEG_PATH, '-y',
-            '-loop', '1', '-framerate', '30', '-t', str(duration), '-i', image_path,
-            '-vf', 'scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:(ow-iw)/2:(oh-ih)/2,setsar=1',
-            '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '28',
-            '-pix_fmt', 'yuv420p', '-r', '30',
-            '-an',
-            segment_path
-        ]
-        print(f"1.{i+1}. Encoding segment {i+1}/{len(image_paths)}...")
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode != 0:
-            raise Exception(f"FFmpeg segment {i+1} failed: {result.stderr[-500:]}")
-        segment_paths.append(segment_path)
+        if segment_paths[i] and os.path.exists(segment_paths[i]):
+            print(f"1.{i+1}. Reusing pre-encoded segment {i+1}/{len(image_paths)}")
+            continue
+        pending.append((i, image_path, duration))
+
+    if pending:
+        workers = min(segment_workers(), len(pending))
+
+        def encode_timed(i, image_path, duration):
+            start = time.perf_counter()
+            print(f"1.{i+1}. Encoding segment {i+1}/{len(image_paths)}...")
+            path, hit = _encode_segment(image_path, duration, os.path.join(temp_dir, f'segment_{i}.mp4'))
+            return path, hit, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(i, executor.submit(encode_timed, i, image_path, duration)) for i, image_path, duration in pending]
+            per_segment = []
+            cache_hits = 0
+            for i, future in futures:
+                segment_paths[i], hit, elapsed = future.result()  # re-raises on failure
+                cache_hits += hit
+                per_segment.append(f'{i+1}:{elapsed:.2f}s')
+        total = time.perf_counter() - start
+
+        # hits and misses counted for this call; the cache itself is shared by every job on the host
+        report = (f"encoded {len(pending)} segments in {total:.2f}s with {workers} workers "
+                  f"x {encode_threads()} threads [{', '.join(per_segment)}]")
+        if segment_cache.enabled:
+            report += (f"; segment cache: {cache_hits} hits, {len(pending) - cache_hits} misses, "
+                       f"{segment_cache.describe_size()}")
+        print(f"1. {report}")
+        if log:
+            log(f'Editor: {report}')
 
     # Step 2: write concat list
     concat_list_path = os.path.join(temp_dir, 'concat_list.txt')
@@ -55,19 +281,44 @@ def stitch_video(image_paths, audio_path, timings, job_id, temp_dir):
         '-shortest',
         output_path
     ]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    with metrics.ffmpeg('concat'):
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=FFMPEG_TIMEOUT)
     if result.returncode != 0:
         raise Exception(f"FFmpeg concat failed: {result.stderr[-500:]}")
 
-    print(f"3. FFmpeg completed successfully")
 
-    if not os.path.exists(output_path):
-        raise Exception("FFmpeg completed but output file was not created")
+def build_filtergraph_cmd(image_paths, audio_path, timings, output_path):
+    """Single FFmpeg call: looped image inputs -> per-input scale/pad -> concat -> mux with audio"""
+    cmd = [_ffmpeg(), '-y']
+    for image_path, duration in zip(image_paths, timings):
+        cmd += ['-loop', '1', '-framerate', '30', '-t', str(duration), '-i', image_path]
+    cmd += ['-i', audio_path]
 
-    file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
-    print(f"Video created: {output_path} ({file_size_mb:.2f} MB)")
+    n = len(image_paths)
+    chains = [f'[{i}:v]{SEGMENT_VF},fps=30,format=yuv420p[v{i}]' for i in range(n)]
+    concat_inputs = ''.join(f'[v{i}]' for i in range(n))
+    chains.append(f'{concat_inputs}concat=n={n}:v=1:a=0[outv]')
 
-    return output_path
+    cmd += [
+        '-filter_complex', ';'.join(chains),
+        '-map', '[outv]', '-map', f'{n}:a',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '28',
+        '-pix_fmt', 'yuv420p', '-r', '30',
+        '-c:a', 'aac', '-b:a', '192k',
+        '-movflags', '+faststart',
+        '-shortest',
+        output_path
+    ]
+    return cmd
+
+
+def _stitch_filtergraph(image_paths, audio_path, timings, output_path):
+    print(f"1. Building filtergraph for {len(image_paths)} slides + audio (single FFmpeg pass)...")
+    cmd = build_filtergraph_cmd(image_paths, audio_path, timings, output_path)
+    with metrics.ffmpeg('filtergraph'):
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=FFMPEG_TIMEOUT)
+    if result.returncode != 0:
+        raise Exception(f"FFmpeg filtergraph failed: {result.stderr[-500:]}")
 
 
 def get_video_info(video_path):
@@ -87,7 +338,8 @@ def get_video_info(video_path):
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
-            check=True
+            check=True,
+            timeout=FFMPEG_TIMEOUT
         )
 
         import json
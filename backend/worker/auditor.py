@@ -1,38 +1,191 @@
 import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import mp3_index
+
+# header-level checks only: every file is validated by reading its container/frame headers,
+# never by decoding or launching FFmpeg, so truncated outputs are caught before assembly/upload
+AUDIT_WORKERS = int(os.getenv('AUDIT_WORKERS', '8'))
+DURATION_TOLERANCE = float(os.getenv('AUDIT_DURATION_TOLERANCE', '1.0'))  # seconds
+
+# --- JPEG ---
+
+# SOFn markers carry the frame dimensions (C4 = DHT, C8 = JPG, CC = DAC are not frames)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def jpeg_dimensions(path):
+    """(width, height) from the SOF segment; raises ValueError on a malformed or truncated JPEG"""
+    with open(path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            raise ValueError('missing SOI marker')
+        f.seek(-2, os.SEEK_END)
+        if f.read(2) != b'\xff\xd9':
+            raise ValueError('missing EOI marker (truncated)')
+        f.seek(2)
+        while True:
+            byte = f.read(1)
+            if not byte:
+                raise ValueError('no SOF segment before end of file')
+            if byte != b'\xff':
+                raise ValueError(f'bad marker at offset {f.tell() - 1}')
+            marker = f.read(1)
+            while marker == b'\xff':  # fill bytes
+                marker = f.read(1)
+            if not marker:
+                raise ValueError('truncated marker')
+            code = marker[0]
+            if code == 0x01 or 0xD0 <= code <= 0xD7:  # standalone markers
+                continue
+            length_bytes = f.read(2)
+            if len(length_bytes) < 2:
+                raise ValueError('truncated segment length')
+            length = struct.unpack('>H', length_bytes)[0]
+            if code in _JPEG_SOF:
+                data = f.read(5)
+                if len(data) < 5:
+                    raise ValueError('truncated SOF segment')
+                height, width = struct.unpack('>HH', data[1:5])
+                if not width or not height:
+                    raise ValueError(f'invalid dimensions {width}x{height}')
+                return width, height
+            if code == 0xDA:
+                raise ValueError('scan data before SOF segment')
+            f.seek(length - 2, os.SEEK_CUR)
+
+# --- MP3 ---
+
+def mp3_duration(path):
+    """Walk every frame header and sum the samples; raises ValueError on garbage or truncation.
+    ID3 tags and Xing/Info frames are skipped wherever they appear."""
+    return mp3_index.index_file(path).duration
+
+# --- MP4 ---
+
+def _read_exact(f, n, what):
+    data = f.read(n)
+    if len(data) != n:
+        raise ValueError(f'{what} at offset {f.tell() - len(data)} runs past end of file (truncated)')
+    return data
+
+def _boxes(f, start, end):
+    """Yield (type, payload_offset, box_end) for the boxes in [start, end)"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, kind = struct.unpack('>I4s', _read_exact(f, 8, 'box header'))
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                raise ValueError(f'box header at offset {offset} runs past end of file (truncated)')
+            size = struct.unpack('>Q', _read_exact(f, 8, 'box size'))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise ValueError(f'{kind.decode("latin-1")} box at offset {offset} runs past end of file (truncated)')
+        yield kind, offset + header, offset + size
+        offset += size
+
+def mp4_duration(path):
+    """Duration from moov/mvhd; raises ValueError if moov, mvhd or mdat is missing or truncated"""
+    with open(path, 'rb') as f:
+        top = {kind: (payload, box_end) for kind, payload, box_end in _boxes(f, 0, os.path.getsize(path))}
+        if b'mdat' not in top:
+            raise ValueError('no mdat box')
+        if b'moov' not in top:
+            raise ValueError('no moov box')
+        moov_start, moov_end = top[b'moov']
+        for kind, payload, box_end in _boxes(f, moov_start, moov_end):
+            if kind != b'mvhd':
+                continue
+            f.seek(payload)
+            version = _read_exact(f, 4, 'mvhd')[0]
+            if payload + (32 if version == 1 else 20) > box_end:
+                raise ValueError('mvhd box too short')
+            if version == 1:
+                f.seek(16, os.SEEK_CUR)
+                timescale, duration = struct.unpack('>IQ', _read_exact(f, 12, 'mvhd'))
+            else:
+                f.seek(8, os.SEEK_CUR)
+                timescale, duration = struct.unpack('>II', _read_exact(f, 8, 'mvhd'))
+            if not timescale:
+                raise ValueError('mvhd timescale is 0')
+            return duration / timescale
+    raise ValueError('no mvhd box in moov')
+
+# --- validators ---
+
+def _concurrently(fn, items):
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=max(1, min(AUDIT_WORKERS, len(items)))) as executor:
+        return list(executor.map(fn, items))
+
+def _check_image(path):
+    """(error, detail) — error is None for a good image"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 'missing or 0 bytes', None
+    try:
+        width, height = jpeg_dimensions(path)
+    except (OSError, ValueError) as e:
+        return str(e), None
+    return None, f'{width}x{height}, {os.path.getsize(path)} bytes'
 
 def validate_images(image_paths):
-    """Returns list of failed indices (missing or 0-byte images)"""
+    """Returns list of failed indices (missing, 0-byte, truncated or malformed JPEGs)"""
     failed = []
-    for i, path in enumerate(image_paths):
-        if not os.path.exists(path) or os.path.getsize(path) == 0:
-            print(f"Auditor: image {i+1} FAILED (missing or 0 bytes)")
+    for i, (error, detail) in enumerate(_concurrently(_check_image, list(image_paths))):
+        if error:
+            print(f"Auditor: image {i+1} FAILED ({error})")
             failed.append(i)
         else:
-            print(f"Auditor: image {i+1} OK ({os.path.getsize(path)} bytes)")
+            print(f"Auditor: image {i+1} OK ({detail})")
     return failed
 
-def validate_audio(audio_path):
-    """Returns True if audio exists and duration > 0.5s"""
-    if not os.path.exists(audio_path) or os.path.getsize(audio_path) == 0:
-        print(f"Auditor: audio FAILED (missing or 0 bytes)")
-        return False
+def _check_audio(path):
+    """(error, duration) — error is None for an intact mp3"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 'missing or 0 bytes', None
     try:
-        from mutagen.mp3 import MP3
-        duration = MP3(audio_path).info.length
-        if duration > 0.5:
-            print(f"Auditor: audio OK ({duration:.2f}s)")
-            return True
-        print(f"Auditor: audio FAILED (duration {duration:.2f}s < 0.5s)")
-        return False
-    except Exception as e:
-        print(f"Auditor: audio validation error — {e}")
+        return None, mp3_duration(path)
+    except (OSError, ValueError) as e:
+        return str(e), None
+
+def validate_audio(audio_path):
+    """Returns True if audio exists, every frame header is intact and duration > 0.5s"""
+    error, duration = _check_audio(audio_path)
+    if error:
+        print(f"Auditor: audio FAILED ({error})")
         return False
+    if duration > 0.5:
+        print(f"Auditor: audio OK ({duration:.2f}s)")
+        return True
+    print(f"Auditor: audio FAILED (duration {duration:.2f}s < 0.5s)")
+    return False
 
-def validate_video(video_path):
-    """Returns True if final video exists and is > 0 bytes"""
+def validate_slide_audio(slide_paths):
+    """Returns list of failed indices (missing, 0-byte or truncated slide mp3s)"""
+    failed = []
+    for i, (error, _) in enumerate(_concurrently(_check_audio, list(slide_paths))):
+        if error:
+            print(f"Auditor: slide audio {i+1} FAILED ({error})")
+            failed.append(i)
+    return failed
+
+def validate_video(video_path, expected_duration=None):
+    """Returns True if the final video has intact top-level boxes, a moov/mvhd, and (when
+    expected_duration is given, i.e. the sum of the slide timings) a matching duration"""
     if not os.path.exists(video_path) or os.path.getsize(video_path) == 0:
-        print(f"Auditor: final video FAILED")
+        print(f"Auditor: final video FAILED (missing or 0 bytes)")
+        return False
+    try:
+        duration = mp4_duration(video_path)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"Auditor: final video FAILED ({e})")
+        return False
+    if expected_duration is not None and abs(duration - expected_duration) > DURATION_TOLERANCE:
+        print(f"Auditor: final video FAILED (duration {duration:.2f}s, expected {expected_duration:.2f}s)")
         return False
     size_mb = os.path.getsize(video_path) / (1024 * 1024)
-    print(f"Auditor: final video OK ({size_mb:.2f} MB)")
+    print(f"Auditor: final video OK ({size_mb:.2f} MB, {duration:.2f}s)")
     return True
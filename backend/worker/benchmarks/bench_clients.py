@@ -0,0 +1,67 @@
+# Per-call latency of Polly/R2 requests with a cold client (built per call, like the old
+# per-job code) versus the warm shared client from clients.py.
+# usage (from backend/worker): python benchmarks/bench_clients.py [iterations]
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import boto3
+import clients
+
+
+def _cold_polly():
+    return boto3.client(
+        'polly',
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        region_name=os.getenv('AWS_REGION', 'us-east-1'),
+    )
+
+
+def _cold_r2():
+    return boto3.client(
+        's3',
+        endpoint_url=f"https://{os.getenv('CLOUDFLARE_ACCOUNT_ID')}.r2.cloudflarestorage.com",
+        aws_access_key_id=os.getenv('CLOUDFLARE_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('CLOUDFLARE_SECRET_ACCESS_KEY'),
+        region_name='auto',
+    )
+
+
+def _time(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<28} p50={statistics.median(samples):7.1f}ms  p95={p95:7.1f}ms  max={samples[-1]:7.1f}ms")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    bucket = os.getenv('R2_BUCKET_NAME')
+    print(f"{iterations} iterations per case\n")
+
+    _report('polly cold (client per call)', _time(lambda: _cold_polly().describe_voices(LanguageCode='en-US'), iterations))
+    clients.get_polly().describe_voices(LanguageCode='en-US')  # warm-up: credentials + TLS
+    _report('polly warm (shared client)', _time(lambda: clients.get_polly().describe_voices(LanguageCode='en-US'), iterations))
+
+    if bucket:
+        _report('r2 cold (client per call)', _time(lambda: _cold_r2().list_objects_v2(Bucket=bucket, MaxKeys=1), iterations))
+        clients.get_r2().list_objects_v2(Bucket=bucket, MaxKeys=1)
+        _report('r2 warm (shared client)', _time(lambda: clients.get_r2().list_objects_v2(Bucket=bucket, MaxKeys=1), iterations))
+    else:
+        print("R2_BUCKET_NAME not set, skipping R2 cases")
+
+
+if __name__ == '__main__':
+    main()
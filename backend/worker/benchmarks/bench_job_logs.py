@@ -0,0 +1,74 @@
+# Write cost per log line against log length: legacy array_append on the videos row versus
+# batched INSERTs into the append-only job_logs table. Uses scratch temp tables only.
+# usage (from backend/worker): python benchmarks/bench_job_logs.py [lines] [batch]
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LINE = '[2026-01-01T00:00:00.000Z] ' + 'Continuity Artist: generating slide image with adaptive concurrency ' * 2
+
+
+def bench_array(cursor, conn, lines, checkpoints):
+    cursor.execute("CREATE TEMP TABLE bench_videos (id UUID PRIMARY KEY, logs TEXT[] DEFAULT '{}')")
+    job_id = str(uuid.uuid4())
+    cursor.execute("INSERT INTO bench_videos (id) VALUES (%s)", (job_id,))
+    conn.commit()
+    results = {}
+    start = time.perf_counter()
+    for n in range(1, lines + 1):
+        cursor.execute("UPDATE bench_videos SET logs = array_append(logs, %s) WHERE id = %s", (LINE, job_id))
+        conn.commit()
+        if n in checkpoints:
+            results[n] = time.perf_counter() - start
+            start = time.perf_counter()
+    return results
+
+
+def bench_table(cursor, conn, lines, checkpoints, batch):
+    cursor.execute("CREATE TEMP TABLE bench_job_logs (job_id UUID NOT NULL, seq BIGSERIAL, line TEXT NOT NULL, PRIMARY KEY (job_id, seq))")
+    conn.commit()
+    job_id = str(uuid.uuid4())
+    results = {}
+    pending = []
+    start = time.perf_counter()
+    for n in range(1, lines + 1):
+        pending.append((job_id, LINE))
+        if len(pending) >= batch or n in checkpoints:
+            execute_values(cursor, "INSERT INTO bench_job_logs (job_id, line) VALUES %s", pending)
+            conn.commit()
+            pending = []
+        if n in checkpoints:
+            results[n] = time.perf_counter() - start
+            start = time.perf_counter()
+    return results
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    batch = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    step = max(1, lines // 10)
+    checkpoints = set(range(step, lines + 1, step))
+
+    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+    cursor = conn.cursor()
+    array = bench_array(cursor, conn, lines, checkpoints)
+    table = bench_table(cursor, conn, lines, checkpoints, batch)
+    conn.close()
+
+    print(f"per-line write cost (ms), {step} lines per row, job_logs batch={batch}\n")
+    print(f"{'log length':>10}  {'array_append':>12}  {'job_logs':>10}")
+    for n in sorted(checkpoints):
+        print(f"{n:>10}  {array[n] / step * 1000:>12.3f}  {table[n] / step * 1000:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# Duration measurement cost per slide mp3: the frame indexer (mp3_index) versus mutagen and an
+# ffprobe subprocess, plus how far each one's duration is from the indexer's exact frame count.
+# usage (from backend/worker): python benchmarks/bench_mp3_index.py [file.mp3 ...] [--iterations N]
+# With no files a synthetic 30s MPEG-2 Layer III stream (24 kHz, like Polly neural) is used.
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mp3_index
+import voice_over
+
+
+def synthetic_mp3(seconds=30.0):
+    """ID3v2 tag + Info frame + CBR 48 kbps 24 kHz mono frames of silence"""
+    header = b'\xff\xf3\x64\xc4'  # MPEG-2 Layer III, 48 kbps, 24000 Hz, mono
+    length = 576 // 8 * 48000 // 24000
+    info = header + b'\x00' * 9 + b'Info' + b'\x00' * (length - 17)
+    frame = header + b'\x00' * (length - 4)
+    tag = b'ID3\x04\x00\x00\x00\x00\x00\x20' + b'\x00' * 32
+    count = int(seconds * 24000 / 576)
+    path = os.path.join(tempfile.gettempdir(), 'bench_mp3_index.mp3')
+    with open(path, 'wb') as f:
+        f.write(tag + info + frame * count)
+    return path
+
+
+def bench(name, fn, path, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        duration = fn(path)
+    elapsed = (time.perf_counter() - start) / iterations
+    return name, elapsed, duration
+
+
+def main():
+    args = sys.argv[1:]
+    iterations = 50
+    if '--iterations' in args:
+        at = args.index('--iterations')
+        iterations = int(args[at + 1])
+        del args[at:at + 2]
+    paths = args or [synthetic_mp3()]
+
+    methods = [
+        ('mp3_index', lambda p: mp3_index.index_file(p).duration),
+        ('mutagen', voice_over.get_audio_duration_mutagen),
+        ('ffprobe', voice_over.get_audio_duration_ffprobe),
+    ]
+    for path in paths:
+        exact = mp3_index.index_file(path)
+        print(f"{os.path.basename(path)}: {os.path.getsize(path)} bytes, {exact.frames} frames, "
+              f"{exact.metadata_bytes} metadata bytes, {exact.duration:.4f}s")
+        for name, fn in methods:
+            runs = iterations if name != 'ffprobe' else max(1, iterations // 10)
+            name, elapsed, duration = bench(name, fn, path, runs)
+            if duration is None:
+                print(f"  {name:<10} unavailable")
+                continue
+            print(f"  {name:<10} {elapsed * 1000:8.2f} ms/file  duration {duration:.4f}s "
+                  f"(delta {duration - exact.duration:+.4f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# Per-job stage manifest, so a retried or redelivered job resumes after its last finished stage
+# instead of paying for GPT, Replicate and Polly again. After every stage the stage context
+# (script + visual bible, image/audio names and timings, final MP4 name, workspace artifact
+# hashes) is written to
+#   keyframe:job:<id>:manifest   JSON {'completed': [stage, ...], 'ctx': {...}, 'updated_at': ts,
+#                                       'failed': true once the job has failed for good}
+#   keyframe:job:<id>:attempts   how many times process_video_job has started for this job
+#   keyframe:job:<id>:attempts:<stage>   how many times a chained stage task has started
+# in Redis (the broker every worker already shares), expiring after CHECKPOINT_TTL.
+# and a lease
+#   keyframe:job:<id>:lock       token of the task running the job right now
+# that expires after JOB_LOCK_TTL unless its holder keeps refreshing it, so a redelivered or re-sent
+# copy of a job that is still running waits for it instead of sharing its job directory.
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+import redis_client
+
+CHECKPOINT = os.getenv('CHECKPOINT', '1') == '1'
+CHECKPOINT_TTL = int(os.getenv('CHECKPOINT_TTL', '86400'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_LOCK_TTL = int(os.getenv('JOB_LOCK_TTL', '120'))
+
+# delete / extend the lease only while it still holds our token
+_RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+_REFRESH = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end return 0"
+
+def manifest_key(job_id):
+    return f'keyframe:job:{job_id}:manifest'
+
+def attempts_key(job_id, stage=None):
+    return f'keyframe:job:{job_id}:attempts' + (f':{stage}' if stage else '')
+
+def lock_key(job_id):
+    return f'keyframe:job:{job_id}:lock'
+
+def load(job_id):
+    """The job's manifest, or None if there is none (or checkpointing is off / Redis is down)"""
+    if not CHECKPOINT:
+        return None
+    try:
+        raw = redis_client.get_client().get(manifest_key(job_id))
+        return json.loads(raw) if raw else None
+    except Exception as e:
+        print(f"Checkpoint: could not load manifest for job {job_id} ({e})")
+        return None
+
+def save(job_id, stage, ctx):
+    """Record stage as finished with its output context; never raises"""
+    if not CHECKPOINT:
+        return
+    manifest = load(job_id) or {'completed': []}
+    if stage not in manifest['completed']:
+        manifest['completed'].append(stage)
+    manifest['ctx'] = ctx
+    manifest['updated_at'] = time.time()
+    try:
+        redis_client.get_client().set(manifest_key(job_id), json.dumps(manifest), ex=CHECKPOINT_TTL)
+    except Exception as e:
+        print(f"Checkpoint: could not save manifest for job {job_id} after {stage} ({e})")
+
+def reset(job_id):
+    """Forget the job's finished stages, so a job that starts over doesn't skip any; never raises"""
+    if not CHECKPOINT:
+        return
+    try:
+        redis_client.get_client().delete(manifest_key(job_id))
+    except Exception as e:
+        print(f"Checkpoint: could not reset manifest for job {job_id} ({e})")
+
+def mark_failed(job_id):
+    """Record that the job failed for good, so a re-sent copy doesn't run it again; never raises"""
+    if not CHECKPOINT:
+        return
+    manifest = load(job_id) or {'completed': []}
+    manifest['failed'] = True
+    manifest['updated_at'] = time.time()
+    try:
+        redis_client.get_client().set(manifest_key(job_id), json.dumps(manifest), ex=CHECKPOINT_TTL)
+    except Exception as e:
+        print(f"Checkpoint: could not mark job {job_id} failed ({e})")
+
+def start_attempt(job_id, stage=None):
+    """Count one more start of this job (or of one of its chained stages); returns the attempt
+    number (1 if Redis is unavailable)"""
+    if not CHECKPOINT:
+        return 1
+    try:
+        client = redis_client.get_client()
+        pipe = client.pipeline()
+        pipe.incr(attempts_key(job_id, stage))
+        pipe.expire(attempts_key(job_id, stage), CHECKPOINT_TTL)
+        return int(pipe.execute()[0])
+    except Exception as e:
+        print(f"Checkpoint: could not count attempts for job {job_id} ({e})")
+        return 1
+
+def _keep_lock(client, job_id, token, stop):
+    while not stop.wait(JOB_LOCK_TTL / 3):
+        try:
+            client.eval(_REFRESH, 1, lock_key(job_id), token, JOB_LOCK_TTL)
+        except Exception as e:
+            print(f"Checkpoint: could not refresh the lock for job {job_id} ({e})")
+
+@contextmanager
+def job_lock(job_id):
+    """Hold the job's lease for the body of the with-block, refreshing it in the background;
+    yields False if another task holds it (True if checkpointing is off or Redis is down)"""
+    if not CHECKPOINT:
+        yield True
+        return
+    token = uuid.uuid4().hex
+    try:
+        client = redis_client.get_client()
+        held = bool(client.set(lock_key(job_id), token, nx=True, ex=JOB_LOCK_TTL))
+    except Exception as e:
+        print(f"Checkpoint: could not take the lock for job {job_id} ({e})")
+        yield True
+        return
+    if not held:
+        yield False
+        return
+    stop = threading.Event()
+    threading.Thread(target=_keep_lock, args=(client, job_id, token, stop), daemon=True).start()
+    try:
+        yield True
+    finally:
+        stop.set()
+        try:
+            client.eval(_RELEASE, 1, lock_key(job_id), token)
+        except Exception as e:
+            print(f"Checkpoint: could not release the lock for job {job_id} ({e})")
@@ -0,0 +1,69 @@
+# Worker-wide registry of long-lived provider clients (Polly, Cloudflare R2, Replicate).
+# boto3 clients are thread-safe, so one client per process is shared by every slide thread
+# and every job; that keeps credential resolution and TLS connections warm between calls.
+import os
+import threading
+import boto3
+from botocore.config import Config
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# should cover the widest thread fan-out: one Polly call per slide, multipart upload threads
+MAX_POOL_CONNECTIONS = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '32'))
+# per-request timeouts: the threads pool enforces no task time limit, so a hung connection
+# would otherwise hold the job's execution slot forever
+R2_READ_TIMEOUT = int(os.getenv('R2_READ_TIMEOUT', '60'))
+REPLICATE_TIMEOUT = float(os.getenv('REPLICATE_TIMEOUT', '60'))
+
+_clients = {}
+_lock = threading.Lock()
+
+def _get(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+                print(f"Clients: created shared {name} client (max_pool_connections={MAX_POOL_CONNECTIONS})")
+    return client
+
+def get_polly():
+    return _get('polly', lambda: boto3.client(
+        'polly',
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        region_name=os.getenv('AWS_REGION', 'us-east-1'),
+        config=Config(connect_timeout=10, read_timeout=30, max_pool_connections=MAX_POOL_CONNECTIONS)
+    ))
+
+def get_r2():
+    return _get('r2', lambda: boto3.client(
+        's3',
+        endpoint_url=f"https://{os.getenv('CLOUDFLARE_ACCOUNT_ID')}.r2.cloudflarestorage.com",
+        aws_access_key_id=os.getenv('CLOUDFLARE_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('CLOUDFLARE_SECRET_ACCESS_KEY'),
+        region_name='auto',
+        config=Config(connect_timeout=10, read_timeout=R2_READ_TIMEOUT, max_pool_connections=MAX_POOL_CONNECTIONS)
+    ))
+
+def _replicate_client():
+    import httpx
+    import replicate
+    # bounds every HTTP call run() makes (create, each poll, output download); the token
+    # comes from REPLICATE_API_TOKEN as with the module-level replicate.run
+    return replicate.Client(timeout=httpx.Timeout(REPLICATE_TIMEOUT, connect=10))
+
+def get_replicate():
+    return _get('replicate', _replicate_client)
+
+def reset():
+    """Drop all clients (after fork, connection pools must not be shared with the parent)"""
+    global _lock
+    _clients.clear()
+    _lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset)
@@ -1,7 +1,13 @@
 import os
+import time
+import atexit
+import datetime
+import threading
 from dotenv import load_dotenv
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extras import execute_values
+import progress
 
 # load environment variables
 load_dotenv()
@@ -11,11 +17,24 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 
 connection_pool = None
 
+# write-behind buffer: status/log updates are queued per job and flushed in one transaction
+# (latest status UPDATE + one multi-row INSERT into job_logs) on a short timer, at stage
+# boundaries (flush_job) and immediately for terminal statuses
+WRITE_BEHIND = os.getenv('DB_WRITE_BEHIND', '1') == '1'
+FLUSH_INTERVAL = float(os.getenv('DB_FLUSH_INTERVAL', '0.5'))
+TERMINAL_STATUSES = {'failed', 'done'}
+
+_pending = {}  # job_id -> {'status': str or None, 'logs': [line, ...]}
+_pending_lock = threading.Lock()
+_flush_lock = threading.RLock()  # one writer at a time, so an older batch never lands after a newer one
+_flusher = None
+
 def init_pool():
 
     global connection_pool
     if connection_pool is None:
-        connection_pool = psycopg2.pool.SimpleConnectionPool(
+        # threaded pool: the write-behind flusher and image status callbacks share it
+        connection_pool = psycopg2.pool.ThreadedConnectionPool(
             1, 10,  # min and max connections
             DATABASE_URL
         )
@@ -32,7 +51,105 @@ def release_connection(conn):
     if connection_pool:
         connection_pool.putconn(conn)
 
+def _enqueue(job_id, status=None, line=None):
+    global _flusher
+    with _pending_lock:
+        entry = _pending.setdefault(job_id, {'status': None, 'logs': []})
+        if status is not None:
+            entry['status'] = status  # supersedes any queued status
+        if line is not None:
+            entry['logs'].append(line)
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name='db-write-behind', daemon=True)
+            _flusher.start()
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush_all()
+
+def flush_all():
+    with _pending_lock:
+        job_ids = list(_pending.keys())
+    for job_id in job_ids:
+        flush_job(job_id)
+
+def flush_job(job_id):
+    """Write everything queued for job_id in a single transaction; re-queues on failure"""
+    with _flush_lock:
+        return _flush_job_locked(job_id)
+
+def _flush_job_locked(job_id):
+    with _pending_lock:
+        entry = _pending.pop(job_id, None)
+    if not entry or (entry['status'] is None and not entry['logs']):
+        return True
+
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        if entry['status'] is not None:
+            cursor.execute("UPDATE videos SET status = %s WHERE id = %s", (entry['status'], job_id))
+        if entry['logs']:
+            _insert_log_lines(cursor, job_id, entry['logs'])
+        conn.commit()
+        cursor.close()
+        return True
+
+    except Exception as e:
+        if conn:
+            try:
+                conn.rollback()
+            except:
+                pass
+        print(f"Error flushing job {job_id} updates: {e}")
+        # put the batch back in front of anything queued meanwhile so nothing is lost
+        with _pending_lock:
+            newer = _pending.get(job_id, {'status': None, 'logs': []})
+            _pending[job_id] = {
+                'status': newer['status'] if newer['status'] is not None else entry['status'],
+                'logs': entry['logs'] + newer['logs'],
+            }
+        return False
+
+    finally:
+        if conn:
+            release_connection(conn)
+
+def _insert_log_lines(cursor, job_id, lines):
+    # append-only child table: seq is a bigserial, so one multi-row INSERT keeps line order
+    # and never rewrites the videos row the feed reads
+    execute_values(
+        cursor,
+        "INSERT INTO job_logs (job_id, line) VALUES %s",
+        [(job_id, line) for line in lines],
+        page_size=500
+    )
+
+def _reset_after_fork():
+    global _flusher, _pending_lock, _flush_lock
+    _flusher = None
+    _pending_lock = threading.Lock()
+    _flush_lock = threading.RLock()
+    _pending.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+atexit.register(flush_all)
+
 def update_job_status(job_id, status):
+    progress.publish(job_id, 'status', status)
+    if WRITE_BEHIND:
+        _enqueue(job_id, status=status)
+        print(f"Job {job_id} status updated to: {status}")
+        if status in TERMINAL_STATUSES:
+            return flush_job(job_id)
+        return True
+    return _write_status(job_id, status)
+
+def _write_status(job_id, status):
     conn = None
     try:
         conn = get_connection()
@@ -61,15 +178,18 @@ def update_job_status(job_id, status):
             release_connection(conn)
 
 def append_job_log(job_id, message):
-    import datetime
+    # timestamp at call time, not flush time
+    timestamp = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    line = f"[{timestamp}] {message}"
+    progress.publish(job_id, 'log', line)
+    if WRITE_BEHIND:
+        _enqueue(job_id, line=line)
+        return
     conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        timestamp = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        line = f"[{timestamp}] {message}"
-        query = "UPDATE videos SET logs = array_append(logs, %s) WHERE id = %s"
-        cursor.execute(query, (line, job_id))
+        _insert_log_lines(cursor, job_id, [line])
         conn.commit()
         cursor.close()
     except Exception as e:
@@ -83,7 +203,16 @@ def append_job_log(job_id, message):
         if conn:
             release_connection(conn)
 
-def update_job_completed(job_id, video_url, thumbnail_url):
+def update_job_completed(job_id, video_url, thumbnail_url, preview_url=None, sprite_url=None):
+    # queued logs/status land before the final 'done' row
+    with _flush_lock:
+        flush_job(job_id)
+        ok = _write_completed(job_id, video_url, thumbnail_url, preview_url, sprite_url)
+    # published after the commit so subscribers reading video_url from Postgres see it
+    progress.publish(job_id, 'status', 'done')
+    return ok
+
+def _write_completed(job_id, video_url, thumbnail_url, preview_url=None, sprite_url=None):
     conn = None
     try:
         conn = get_connection()
@@ -91,10 +220,10 @@ def update_job_completed(job_id, video_url, thumbnail_url):
 
         query = """
             UPDATE videos 
-            SET status = %s, video_url = %s, thumbnail_url = %s 
+            SET status = %s, video_url = %s, thumbnail_url = %s, preview_url = %s, sprite_url = %s
             WHERE id = %s
         """
-        cursor.execute(query, ('done', video_url, thumbnail_url, job_id))
+        cursor.execute(query, ('done', video_url, thumbnail_url, preview_url, sprite_url, job_id))
         
         conn.commit()
         cursor.close()
@@ -0,0 +1,226 @@
+# Content-addressed, size-bounded LRU cache of files on local disk.
+# Entries are plain files named <key><suffix>; recency is tracked with the file mtime,
+# which is bumped on every hit, so several worker processes can share one directory.
+# Optional metadata is stored next to each entry as <key>.json.
+import os
+import json
+import shutil
+import hashlib
+import uuid
+
+
+def hash_key(*parts):
+    """sha256 over the given parts (bytes are used as-is, everything else via str())"""
+    h = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode('utf-8')
+        h.update(len(data).to_bytes(8, 'big'))
+        h.update(data)
+    return h.hexdigest()
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RedisIndex:
+    """Optional shared index (key -> path + metadata) so workers on one host find each other's entries"""
+
+    def __init__(self, prefix, client_factory):
+        self.prefix = prefix
+        self._client_factory = client_factory
+
+    def _client(self):
+        try:
+            return self._client_factory()
+        except Exception as e:
+            print(f"Cache index {self.prefix}: redis unavailable ({e})")
+            return None
+
+    def lookup(self, key):
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            raw = client.hget(f'{self.prefix}:entries', key)
+            return json.loads(raw) if raw is not None else None
+        except Exception as e:
+            print(f"Cache index {self.prefix}: lookup failed ({e})")
+            return None
+
+    def record(self, key, entry):
+        client = self._client()
+        if client is None:
+            return
+        try:
+            client.hset(f'{self.prefix}:entries', key, json.dumps(entry))
+        except Exception as e:
+            print(f"Cache index {self.prefix}: record failed ({e})")
+
+    def forget(self, key):
+        client = self._client()
+        if client is None:
+            return
+        try:
+            client.hdel(f'{self.prefix}:entries', key)
+        except Exception as e:
+            print(f"Cache index {self.prefix}: forget failed ({e})")
+
+
+class DiskCache:
+
+    def __init__(self, name, directory, max_bytes, index=None):
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index = index
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, f'{key}{suffix}')
+
+    def _meta_path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key, suffix):
+        """Path of the cached entry (and mark it recently used), or None on a miss"""
+        if not self.enabled:
+            return None
+        path = self._path(key, suffix)
+        try:
+            os.utime(path, None)
+        except OSError:
+            path = self._from_index(key)
+        return path
+
+    def _from_index(self, key):
+        """Entry written by another worker into a different directory on this host"""
+        if self.index is None:
+            return None
+        entry = self.index.lookup(key)
+        if not entry or not entry.get('path'):
+            return None
+        try:
+            os.utime(entry['path'], None)
+        except OSError:
+            self.index.forget(key)
+            return None
+        return entry['path']
+
+    def get_meta(self, key):
+        """Metadata stored with put(..., meta=...), or None"""
+        try:
+            with open(self._meta_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        if self.index is not None:
+            entry = self.index.lookup(key)
+            if entry:
+                return entry.get('meta')
+        return None
+
+    def fetch(self, key, suffix, dest_path):
+        """Materialise a cached entry at dest_path; returns False on a miss"""
+        path = self.get(key, suffix)
+        if path is None:
+            return False
+        try:
+            # a copy rather than a hard link: callers rewrite these paths in place
+            # (ffmpeg -y, open('wb')), which would otherwise corrupt the cached entry
+            shutil.copyfile(path, dest_path)
+            return True
+        except OSError as e:
+            # evicted by another process between get() and the copy
+            print(f"{self.name} cache: entry {key[:12]} vanished ({e}), treating as miss")
+            return False
+
+    def put(self, key, suffix, src_path, meta=None):
+        """Copy src_path into the cache atomically, then evict down to max_bytes"""
+        if not self.enabled:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key, suffix)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            if meta is not None:
+                # sidecar first, so an entry is never visible without its metadata
+                meta_tmp = f'{self._meta_path(key)}.{uuid.uuid4().hex}.tmp'
+                with open(meta_tmp, 'w') as f:
+                    json.dump(meta, f)
+                os.replace(meta_tmp, self._meta_path(key))
+            shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"{self.name} cache: could not store {key[:12]} ({e})")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+        if self.index is not None:
+            self.index.record(key, {'path': path, 'meta': meta})
+        self.evict()
+        return path
+
+    def discard(self, key, suffix):
+        """Remove one entry, e.g. when a downstream check rejected the cached file"""
+        for path in (self._path(key, suffix), self._meta_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if self.index is not None:
+            self.index.forget(key)
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if name.endswith('.tmp') or name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """Drop least-recently-used entries until the cache fits in max_bytes"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+            key = os.path.splitext(os.path.basename(path))[0]
+            try:
+                os.remove(self._meta_path(key))
+            except OSError:
+                pass
+            if self.index is not None:
+                self.index.forget(key)
+        return total
+
+    def size_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def describe_size(self):
+        """'<used>/<max> MB' for job logs (hits and misses are counted per job by the callers)"""
+        return f"{self.size_bytes() / (1024 * 1024):.1f}/{self.max_bytes / (1024 * 1024):.0f} MB"
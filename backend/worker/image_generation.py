@@ -1,10 +1,95 @@
 import os
 import time
-import replicate
+import threading
+import clients
+import metrics
 from concurrent.futures import ThreadPoolExecutor
 
-BATCH_SIZE = 1
-def generate_images(script_json, job_id, style=None, temp_dir=None, session_seed=None, status_callback=None):
+IMAGE_CONCURRENCY_START = int(os.getenv('IMAGE_CONCURRENCY_START', '4'))
+IMAGE_CONCURRENCY_MAX = int(os.getenv('IMAGE_CONCURRENCY_MAX', '12'))
+
+
+class AimdLimiter:
+    """Additive-increase / multiplicative-decrease cap on in-flight Replicate predictions.
+    Every success raises the cap by 1/cap, so a full window of successes raises it by one; a
+    429 or timeout halves it, at most once per window: throttles from calls that started
+    before the last cut were caused by the old cap and are ignored."""
+
+    def __init__(self, start, maximum, minimum=1):
+        self.limit = float(max(minimum, min(start, maximum)))
+        self.maximum = maximum
+        self.minimum = minimum
+        self.in_flight = 0
+        self.cuts = 0  # how many times the cap has been cut; tags each call with its window
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot; returns the call's window, to hand to on_throttle"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            return self.cuts
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self, window):
+        with self._cond:
+            if window != self.cuts:
+                return
+            self.cuts += 1
+            self.limit = max(self.minimum, self.limit / 2)
+            print(f"Replicate throttled: image concurrency cut to {int(self.limit)}")
+
+
+# shared by every job in this worker process — Replicate's rate limit is per account
+limiter = AimdLimiter(IMAGE_CONCURRENCY_START, IMAGE_CONCURRENCY_MAX)
+
+
+def _download(file_output, image_path, sink=None):
+    """Stream a Replicate output to disk chunk by chunk (bounded memory), optionally teeing
+    the bytes into a running segment encoder. The file only appears once it is complete."""
+    part_path = f'{image_path}.part'
+    try:
+        with open(part_path, 'wb') as f:
+            for chunk in file_output:
+                f.write(chunk)
+                if sink:
+                    sink.write(chunk)
+        os.replace(part_path, image_path)
+    except Exception:
+        if sink:
+            sink.abort()
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
+    if sink:
+        sink.close()
+
+
+def _is_throttle(e):
+    err_str = str(e).lower()
+    return '429' in err_str or 'timeout' in err_str or 'timed out' in err_str or isinstance(e, TimeoutError)
+
+
+def image_path_for(temp_dir, i):
+    return os.path.join(temp_dir, f'image_{i}.jpg')
+
+
+def generate_images(script_json, job_id, style=None, temp_dir=None, session_seed=None, status_callback=None, on_image=None, image_sink=None, indices=None):
+    """Generate one image per slide; returns the full list of image paths in slide order.
+    With indices, only those slides are regenerated (auditor retries) and the images
+    already on disk for every other slide are kept."""
     slides = script_json.get('slides', [])
     visual_bible = script_json.get('visual_bible', {})
     content_type = script_json.get('content_type', 'general')
@@ -40,10 +125,26 @@ def generate_images(script_json, job_id, style=None, temp_dir=None, session_seed
     print(f"Using Replicate (Flux-Schnell) for content_type={content_type}")
 
     os.makedirs(temp_dir, exist_ok=True)
-    image_paths = [None] * len(slides)
+    image_paths = [image_path_for(temp_dir, i) for i in range(len(slides))]
+    todo = list(range(len(slides))) if indices is None else sorted(set(indices))
+
+    in_flight = set()
+    status_lock = threading.Lock()
+
+    def report(i, started):
+        # per-slide agent status: the set of slides currently being painted
+        with status_lock:
+            if started:
+                in_flight.add(i)
+            else:
+                in_flight.discard(i)
+            if status_callback and in_flight:
+                status_callback(f'agent_artist_slides_{",".join(str(n + 1) for n in sorted(in_flight))}')
 
     def generate_single(i, prompt):
         for attempt in range(1, 4):
+            window = limiter.acquire()
+            report(i, True)
             try:
                 replicate_input = {
                     "prompt": prompt,
@@ -56,41 +157,43 @@ def generate_images(script_json, job_id, style=None, temp_dir=None, session_seed
                 if session_seed is not None:
                     replicate_input["seed"] = session_seed
 
-                output = replicate.run(
-                    "black-forest-labs/flux-schnell",
-                    input=replicate_input
-                )
-                image_bytes = output[0].read()
-                image_path = os.path.join(temp_dir, f'image_{i}.jpg')
-                with open(image_path, 'wb') as f:
-                    f.write(image_bytes)
-                print(f"Image {i+1}/{len(slides)} generated: {image_path}")
-                return image_path
+                with metrics.provider_call('replicate', 'flux-schnell'):
+                    output = clients.get_replicate().run(
+                        "black-forest-labs/flux-schnell",
+                        input=replicate_input
+                    )
+                image_path = image_path_for(temp_dir, i)
+                _download(output[0], image_path, image_sink(i) if image_sink else None)
             except Exception as e:
                 err_str = str(e)
+                throttled = _is_throttle(e)
+                if throttled:
+                    limiter.on_throttle(window)
+                limiter.release()
+                report(i, False)
                 print(f"Image {i+1} attempt {attempt}/3 failed: {err_str}")
                 if attempt < 3:
-                    wait = 15 if '429' in err_str else 3
+                    metrics.retry('image')
+                    wait = 15 if throttled else 3
                     time.sleep(wait)
+                continue
+
+            print(f"Image {i+1}/{len(slides)} generated: {image_path}")
+            limiter.on_success()
+            limiter.release()
+            report(i, False)
+            if on_image:
+                on_image(i, image_path)
+            return image_path
         raise Exception(f"Image {i+1} failed after 3 attempts")
 
-    print(f"Generating {len(slides)} images in batches of {BATCH_SIZE}...")
+    print(f"Generating {len(todo)}/{len(slides)} images with adaptive concurrency (cap {int(limiter.limit)}, max {limiter.maximum})...")
 
-    for batch_start in range(0, len(slides), BATCH_SIZE):
-        batch_indices = list(range(batch_start, min(batch_start + BATCH_SIZE, len(slides))))
-        batch_nums = [str(i + 1) for i in batch_indices]
-
-        if status_callback:
-            status_callback(f'agent_artist_slides_{",".join(batch_nums)}')
-
-        print(f"Batch: slides {batch_nums}")
-
-        with ThreadPoolExecutor(max_workers=BATCH_SIZE) as executor:
-            futures = [executor.submit(generate_single, i, image_prompts[i]) for i in batch_indices]
-
-
-        for future, i in zip(futures, batch_indices):
+    # every slide is queued at once; the limiter decides how many predictions are in flight
+    with ThreadPoolExecutor(max_workers=max(1, min(IMAGE_CONCURRENCY_MAX, len(todo)))) as executor:
+        futures = [(i, executor.submit(generate_single, i, image_prompts[i])) for i in todo]
+        for i, future in futures:
             image_paths[i] = future.result()  # re-raises on failure
 
-    print(f"All {len(image_paths)} images generated successfully")
+    print(f"{len(todo)} images generated successfully")
     return image_paths
@@ -0,0 +1,213 @@
+# Fair job intake. With FAIR_INTAKE=1 the API pushes each job onto a per-client intake queue
+#   keyframe:intake:<tier>:<user>   LPUSH'd JSON job (+ user = client IP, tier, enqueued_at)
+#   keyframe:intake:flows           set of '<tier>:<user>' flows that may have jobs waiting
+# and this dispatcher (`python intake.py`, one active per deployment) feeds process_video_job
+# with start-time weighted fair queuing across flows: each client gets a share of the workers in
+# proportion to their tier's weight, so a burst from one client only delays that client's own
+# jobs. The API puts every job in the 'standard' tier; other tiers only matter once something
+# server-side assigns them.
+# It keeps at most INTAKE_MAX_QUEUED tasks waiting on the Celery list and the stage queues so the
+# fairness decision is made just before a worker is free, not when the job arrives. The stage
+# queues count too because in PIPELINE_MODE=chain process_video_job only dispatches the chain
+# and returns: limiting the Celery list alone would move every job straight onto them in
+# arrival order. A job the dispatcher sends twice (see recover) doesn't run twice at once:
+# process_video_job holds a per-job lease (see checkpoint.py).
+import os
+import json
+import time
+import uuid
+import redis_client
+from app import app, STAGE_IO_QUEUE, STAGE_CPU_QUEUE
+
+INTAKE_TIER_WEIGHTS = {
+    tier.strip(): float(weight)
+    for tier, weight in (
+        pair.split(':') for pair in os.getenv('INTAKE_TIER_WEIGHTS', 'standard:1').split(',') if pair.strip()
+    )
+}
+INTAKE_MAX_QUEUED = int(os.getenv('INTAKE_MAX_QUEUED', '2'))
+INTAKE_POLL_INTERVAL = float(os.getenv('INTAKE_POLL_INTERVAL', '0.5'))
+INTAKE_WAIT_SAMPLES = int(os.getenv('INTAKE_WAIT_SAMPLES', '500'))
+
+CELERY_QUEUE = 'celery'
+FLOWS_KEY = 'keyframe:intake:flows'
+DISPATCHING_KEY = 'keyframe:intake:dispatching'
+LOCK_KEY = 'keyframe:intake:dispatcher'
+LOCK_TTL = 30
+STATS_INTERVAL = 60
+
+def queue_key(flow):
+    return f'keyframe:intake:{flow}'
+
+def wait_key(tier):
+    return f'keyframe:intake:wait:{tier}'
+
+
+class FairQueue:
+    """Start-time fair queuing over flows ('<tier>:<user>'). When a flow's next job reaches the
+    head of its queue it is tagged start = max(V, flow's last finish), finish = start + 1/weight;
+    the backlogged flow with the smallest finish tag goes next and the virtual time V moves to
+    that job's start tag"""
+
+    def __init__(self, weights):
+        self.weights = weights
+        self.virtual_time = 0.0
+        self.finish = {}
+        self.head = {}  # flow -> (start, finish) of the job at the head of its queue
+
+    def weight(self, flow):
+        return self.weights.get(flow.split(':', 1)[0], 1.0)
+
+    def _tags(self, flow):
+        if flow not in self.head:
+            start = max(self.virtual_time, self.finish.get(flow, 0.0))
+            self.head[flow] = (start, start + 1.0 / self.weight(flow))
+        return self.head[flow]
+
+    def pick(self, flows):
+        """The flow to serve next out of the backlogged ones (ties go to the higher weight)"""
+        return min(flows, key=lambda flow: (self._tags(flow)[1], -self.weight(flow), flow))
+
+    def charge(self, flow):
+        start, finish = self._tags(flow)
+        del self.head[flow]
+        self.finish[flow] = finish
+        self.virtual_time = start
+
+    def forget_idle(self, active):
+        # an idle flow's tag falls behind V anyway; dropping it keeps the table bounded
+        for flow in [f for f in self.head if f not in active]:
+            del self.head[flow]
+        for flow in [f for f, finish in self.finish.items() if f not in active and finish <= self.virtual_time]:
+            del self.finish[flow]
+
+
+def record_wait(tier, seconds):
+    """Add one queue-wait sample (enqueue to worker start) for a tier; never raises"""
+    try:
+        pipe = redis_client.get_client().pipeline(transaction=False)
+        pipe.lpush(wait_key(tier), f'{seconds:.3f}')
+        pipe.ltrim(wait_key(tier), 0, INTAKE_WAIT_SAMPLES - 1)
+        pipe.execute()
+    except Exception as e:
+        print(f"Intake: could not record queue wait ({e})")
+
+def wait_stats(tier):
+    """{'count', 'p50', 'p95', 'max'} over the tier's recent queue-wait samples, or None"""
+    try:
+        samples = sorted(float(v) for v in redis_client.get_client().lrange(wait_key(tier), 0, -1))
+    except Exception as e:
+        print(f"Intake: could not read queue wait samples ({e})")
+        return None
+    if not samples:
+        return None
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {'count': len(samples), 'p50': pick(0.5), 'p95': pick(0.95), 'max': samples[-1]}
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+def _backlogged_flows(client):
+    flows = sorted(_decode(f) for f in client.smembers(FLOWS_KEY))
+    pipe = client.pipeline(transaction=False)
+    for flow in flows:
+        pipe.llen(queue_key(flow))
+    lengths = pipe.execute()
+    backlogged = []
+    for flow, length in zip(flows, lengths):
+        if length:
+            backlogged.append(flow)
+            continue
+        # drop the drained flow, then re-add it if the API pushed a job in between
+        client.srem(FLOWS_KEY, flow)
+        if client.llen(queue_key(flow)):
+            client.sadd(FLOWS_KEY, flow)
+            backlogged.append(flow)
+    return backlogged
+
+def _send(client, raw):
+    job = json.loads(raw)
+    app.send_task('orchestrator.process_video_job', args=[job])
+    client.lrem(DISPATCHING_KEY, 1, raw)
+    return job
+
+def recover(client):
+    """Re-queue jobs a previous dispatcher took but may not have sent (at the front of their flow)"""
+    for raw in client.lrange(DISPATCHING_KEY, 0, -1):
+        job = json.loads(raw)
+        flow = f"{job.get('tier', 'standard')}:{job.get('user') or 'anonymous'}"
+        client.rpush(queue_key(flow), raw)
+        client.sadd(FLOWS_KEY, flow)
+        client.lrem(DISPATCHING_KEY, 1, raw)
+        print(f"Intake: re-queued job {job.get('id')} left over from a previous dispatcher")
+
+def dispatch_once(client, fair_queue):
+    """Top the Celery and stage queues up to INTAKE_MAX_QUEUED tasks; returns how many jobs were
+    dispatched"""
+    dispatched = 0
+    pipe = client.pipeline(transaction=False)
+    for queue in (CELERY_QUEUE, STAGE_IO_QUEUE, STAGE_CPU_QUEUE):
+        pipe.llen(queue)
+    room = INTAKE_MAX_QUEUED - sum(pipe.execute())
+    while room > 0:
+        backlogged = _backlogged_flows(client)
+        fair_queue.forget_idle(set(backlogged))
+        if not backlogged:
+            break
+        flow = fair_queue.pick(backlogged)
+        # the job sits on the dispatching list until Celery has it, so a crash can't lose it
+        raw = client.rpoplpush(queue_key(flow), DISPATCHING_KEY)
+        if raw is None:
+            continue
+        fair_queue.charge(flow)
+        job = _send(client, raw)
+        waited = time.time() - float(job.get('enqueued_at') or time.time())
+        print(f"Intake: job {job.get('id')} from {flow} dispatched after {waited:.1f}s in intake")
+        dispatched += 1
+        room -= 1
+    return dispatched
+
+
+def _hold_lock(client, token):
+    if client.set(LOCK_KEY, token, nx=True, ex=LOCK_TTL):
+        return True
+    if _decode(client.get(LOCK_KEY)) == token:
+        client.expire(LOCK_KEY, LOCK_TTL)
+        return True
+    return False
+
+def _log_stats():
+    for tier in INTAKE_TIER_WEIGHTS:
+        stats = wait_stats(tier)
+        if stats:
+            print(f"Intake: queue wait [{tier}] p50={stats['p50']:.1f}s p95={stats['p95']:.1f}s max={stats['max']:.1f}s (n={stats['count']})")
+
+def run():
+    client = redis_client.get_client()
+    fair_queue = FairQueue(INTAKE_TIER_WEIGHTS)
+    token = uuid.uuid4().hex
+    leader = False
+    last_stats = time.time()
+    print(f"Intake: dispatcher starting, weights={INTAKE_TIER_WEIGHTS}, max queued={INTAKE_MAX_QUEUED}")
+    while True:
+        try:
+            if not _hold_lock(client, token):
+                leader = False
+                time.sleep(LOCK_TTL / 3)
+                continue
+            if not leader:
+                leader = True
+                recover(client)
+            dispatch_once(client, fair_queue)
+            if time.time() - last_stats > STATS_INTERVAL:
+                last_stats = time.time()
+                _log_stats()
+        except Exception as e:
+            print(f"Intake: dispatch error ({e})")
+            time.sleep(5)
+        time.sleep(INTAKE_POLL_INTERVAL)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,125 @@
+# Prometheus metrics for the worker pipeline: stage latency, provider call latency and errors,
+# retries, queue wait, bytes produced and FFmpeg wall time. Exposed by the worker process on
+# http://<host>:METRICS_PORT/metrics when METRICS_PORT is set, and/or written after every job to
+# METRICS_TEXTFILE in the text exposition format (node_exporter textfile collector, or curl it
+# to a pushgateway). One registry per process — with --pool threads that is the whole worker.
+# prometheus_client is optional: without it every helper here is a no-op.
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import prometheus_client as prom
+except ImportError:
+    prom = None
+
+METRICS_PORT = int(os.getenv('METRICS_PORT') or 0)
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE', '')
+
+_STAGE_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 240, 300)
+_CALL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 90)
+_WAIT_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+if prom:
+    STAGE_SECONDS = prom.Histogram(
+        'keyframe_stage_seconds', 'Wall time of a pipeline stage',
+        ['stage'], buckets=_STAGE_BUCKETS)
+    PROVIDER_SECONDS = prom.Histogram(
+        'keyframe_provider_call_seconds', 'Latency of a call to an external provider',
+        ['provider', 'operation'], buckets=_CALL_BUCKETS)
+    PROVIDER_ERRORS = prom.Counter(
+        'keyframe_provider_errors_total', 'Failed provider calls by exception class',
+        ['provider', 'operation', 'error'])
+    RETRIES = prom.Counter(
+        'keyframe_retries_total', 'Retries by kind (image, script, audit_images, audit_audio, time_limit)',
+        ['kind'])
+    QUEUE_WAIT = prom.Histogram(
+        'keyframe_queue_wait_seconds', 'Time from enqueue to the worker starting the job',
+        ['tier'], buckets=_WAIT_BUCKETS)
+    BYTES_PRODUCED = prom.Counter(
+        'keyframe_bytes_produced_total', 'Bytes of output uploaded, by kind',
+        ['kind'])
+    FFMPEG_SECONDS = prom.Histogram(
+        'keyframe_ffmpeg_seconds', 'Wall time of an FFmpeg invocation',
+        ['operation'], buckets=_CALL_BUCKETS)
+    JOBS = prom.Counter(
+        'keyframe_jobs_total', 'Finished jobs by outcome',
+        ['status'])
+
+_started = False
+_lock = threading.Lock()
+
+def start():
+    """Serve /metrics on METRICS_PORT (once per process)"""
+    global _started
+    if not prom or not METRICS_PORT:
+        return
+    with _lock:
+        if _started:
+            return
+        _started = True
+    try:
+        prom.start_http_server(METRICS_PORT)
+        print(f"Metrics: serving Prometheus metrics on :{METRICS_PORT}/metrics")
+    except OSError as e:
+        print(f"Metrics: could not listen on :{METRICS_PORT} ({e})")
+
+def write_textfile():
+    """Write the registry to METRICS_TEXTFILE (atomically); never raises"""
+    if not prom or not METRICS_TEXTFILE:
+        return
+    try:
+        prom.write_to_textfile(METRICS_TEXTFILE, prom.REGISTRY)
+    except Exception as e:
+        print(f"Metrics: could not write {METRICS_TEXTFILE} ({e})")
+
+def observe_stage(stage, seconds):
+    if prom:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+@contextmanager
+def provider_call(provider, operation):
+    """Time a provider call; a raised exception is counted by class and re-raised"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        if prom:
+            PROVIDER_ERRORS.labels(provider, operation, type(e).__name__).inc()
+        raise
+    finally:
+        if prom:
+            PROVIDER_SECONDS.labels(provider, operation).observe(time.perf_counter() - start)
+
+@contextmanager
+def ffmpeg(operation):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_ffmpeg(operation, time.perf_counter() - start)
+
+def observe_ffmpeg(operation, seconds):
+    if prom:
+        FFMPEG_SECONDS.labels(operation).observe(seconds)
+
+def retry(kind, count=1):
+    if prom:
+        RETRIES.labels(kind).inc(count)
+
+def queue_wait(tier, seconds):
+    if prom:
+        QUEUE_WAIT.labels(tier).observe(seconds)
+
+def bytes_produced(kind, path):
+    if prom:
+        try:
+            BYTES_PRODUCED.labels(kind).inc(os.path.getsize(path))
+        except OSError:
+            pass
+
+def job_finished(status):
+    if prom:
+        JOBS.labels(status).inc()
+    write_textfile()
@@ -0,0 +1,123 @@
+# Single-pass MPEG audio frame indexer: walks the frame headers of an MP3 once and records
+# where the audio frames are, skipping ID3v2/ID3v1 tags and Xing/Info/VBRI header frames.
+# The index gives an exact duration (samples actually played) and lets callers concatenate
+# files by copying only their audio frames — no mutagen, no ffprobe subprocess.
+from collections import namedtuple
+
+# ranges: [(start, end)] byte spans of audio frames; metadata_bytes: tags + header frames skipped
+Mp3Index = namedtuple('Mp3Index', 'ranges frames samples sample_rate duration metadata_bytes')
+
+_BITRATES = {  # (version_is_mpeg1, layer) -> kbps by index
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_BITRATES[(False, 3)] = _BITRATES[(False, 2)]
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def parse_frame_header(data, offset=0):
+    """(frame_length, samples, sample_rate, side_info_offset) for the 4-byte MPEG audio header
+    at offset, or None if there is no valid header there"""
+    if offset + 4 > len(data) or data[offset] != 0xFF or (data[offset + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    version = (b1 >> 3) & 0x03   # 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    padding = (b2 >> 1) & 0x01
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate, 4
+    samples = 1152 if (layer == 2 or mpeg1) else 576
+    mono = (b3 >> 6) == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate, 4 + side_info
+
+
+def id3v2_size(data, offset=0):
+    """Total size of an ID3v2 tag at offset (header + body + optional footer), or 0"""
+    if data[offset:offset + 3] != b'ID3' or offset + 10 > len(data):
+        return 0
+    size = (data[offset + 6] << 21) | (data[offset + 7] << 14) | (data[offset + 8] << 7) | data[offset + 9]
+    footer = 10 if data[offset + 5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _is_info_frame(data, offset, side_info, length):
+    """Xing/Info (LAME) or VBRI header frame: decodes as silence, carries only metadata"""
+    frame = data[offset:offset + length]
+    return frame[side_info:side_info + 4] in (b'Xing', b'Info') or frame[36:40] == b'VBRI'
+
+
+def index_bytes(data):
+    """Index an in-memory MP3; raises ValueError on garbage between frames or a truncated frame"""
+    data = memoryview(data) if not isinstance(data, memoryview) else data
+    end = len(data)
+    if end >= 128 and data[end - 128:end - 125] == b'TAG':  # ID3v1 trailer
+        end -= 128
+
+    ranges = []
+    frames = samples = 0
+    duration = 0.0
+    sample_rate = None
+    metadata = len(data) - end
+    run_start = None
+    first_in_run = True
+    offset = 0
+    while offset < end:
+        tag = id3v2_size(data, offset)
+        if tag:
+            if run_start is not None:
+                ranges.append((run_start, offset))
+                run_start = None
+            metadata += tag
+            offset += tag
+            first_in_run = True
+            continue
+        header = parse_frame_header(data, offset)
+        if header is None:
+            raise ValueError(f'no frame sync at offset {offset}')
+        length, frame_samples, frame_rate, side_info = header
+        if offset + length > end:
+            raise ValueError(f'frame at offset {offset} runs past end of file (truncated)')
+        if first_in_run and _is_info_frame(data, offset, side_info, length):
+            metadata += length
+            offset += length
+            first_in_run = False
+            continue
+        # slides voiced by different Polly engines can differ in sample rate (22050 vs 24000)
+        sample_rate = sample_rate or frame_rate
+        duration += frame_samples / frame_rate
+        if run_start is None:
+            run_start = offset
+        first_in_run = False
+        frames += 1
+        samples += frame_samples
+        offset += length
+    if run_start is not None:
+        ranges.append((run_start, offset))
+    if not frames:
+        raise ValueError('no audio frames')
+    return Mp3Index(ranges, frames, samples, sample_rate, duration, metadata)
+
+
+def index_file(path):
+    with open(path, 'rb') as f:
+        return index_bytes(f.read())
+
+
+def write_audio_frames(path, index, outfile):
+    """Append only the audio frames of path (per its index) to an open binary file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    for start, end in index.ranges:
+        outfile.write(data[start:end])
+    return sum(end - start for start, end in index.ranges)
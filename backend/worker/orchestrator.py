@@ -1,18 +1,27 @@
 #This will run the full ai pipeline
 import os
 import random
-import tempfile
-import shutil
-from concurrent.futures import ThreadPoolExecutor
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, Future
+from celery import chain
+from celery.exceptions import SoftTimeLimitExceeded
 from dotenv import load_dotenv
 import database
 import script
+import script_cache
 import image_generation
 import voice_over
 import assemble
 import storage
 import watchman
 import auditor
+import workspace
+import checkpoint
+import intake
+import metrics
+from scheduler import SlideScheduler
+from timing import JobClock
 from app import app
 
 #load environment variables for utility functions
@@ -20,152 +29,539 @@ load_dotenv()
 
 MAX_RETRIES = 3
 
-@app.task(bind=True)
-def process_video_job(self, job_data):
-    """
-    Main task that processes a video generation job
-    Takes job_data dict with: { id, prompt, style }
-    """
-    job_id = job_data['id']
-    prompt = job_data['prompt']
-    style = job_data.get('style', 'Default')
+# 'inline' runs every stage inside process_video_job (one worker does the whole job);
+# 'chain' dispatches the stages as chained tasks routed to the I/O and CPU queues (see app.py)
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'inline').strip().lower()
+# encode segments during generation on the node running the assets stage; turn off on
+# I/O-only nodes so all FFmpeg work lands on the CPU queue
+EARLY_ENCODE = os.getenv('EARLY_ENCODE', '1') == '1'
 
-    session_seed = random.randint(1, 2147483647)
-    temp_dir = os.path.join(tempfile.gettempdir(), f'keyframe_job_{job_id}')
-    os.makedirs(temp_dir, exist_ok=True)
-    print(f"Created job temp directory: {temp_dir}")
+# The pipeline is five stages over a JSON-serialisable context:
+#   id, prompt, style, session_seed, clock    set by process_video_job
+#   script (incl. visual_bible, timings)      director
+#   prefetched                                director (streamed narration, by slide index)
+#   images, audio, segments                   assets   (names relative to the workspace)
+#   video                                     assemble
+#   video_url, thumbnail_url                  upload
+#   artifacts                                 name -> sha256 of files pushed to the shared workspace
 
-    try:
-        # --- The Watchman: verify environment before spending any API credits ---
-        database.update_job_status(job_id, 'agent_watchman_active')
-        database.append_job_log(job_id, 'Watchman: starting pre-flight checks...')
-        print(f"Starting job {job_id}")
+def _log(ctx, message):
+    database.append_job_log(ctx['id'], message)
+
+def _paths(ctx, names):
+    return [workspace.path(ctx['id'], name) for name in names]
+
+def _artifact_names(ctx):
+    names = list(ctx.get('images', []))
+    names += [os.path.basename(voice_over.slide_audio_path('', i)) for i in range(len(ctx.get('images', [])))]
+    if ctx.get('audio'):
+        names.append(ctx['audio'])
+    names += [entry['name'] for entry in ctx.get('segments', []) if entry]
+    names += [entry['name'] for entry in ctx.get('prefetched', {}).values()]
+    if ctx.get('video'):
+        names.append(ctx['video'])
+    return names
+
+
+def run_director(ctx, clock, temp_dir):
+    job_id, prompt, style = ctx['id'], ctx['prompt'], ctx['style']
+
+    # --- The Watchman: verify environment before spending any API credits ---
+    database.update_job_status(job_id, 'agent_watchman_active')
+    _log(ctx, 'Watchman: starting pre-flight checks...')
+    print(f"Starting job {job_id}")
+    with clock.stage('watchman'):
         watchman.preflight(job_id)
-        database.append_job_log(job_id, 'Watchman: all services reachable. Environment OK.')
-
-        # --- The Director: script + global visual bible ---
-        database.update_job_status(job_id, 'agent_director_writing')
-        database.append_job_log(job_id, f'Director: generating script for style="{style}"...')
-        print(f"Job {job_id}: Generating script...")
-        script_data = script.generate_script(prompt, style)
-        database.append_job_log(job_id, f'Director: script ready — {len(script_data.get("slides", []))} slides, content_type={script_data.get("content_type","general")}')
-        database.append_job_log(job_id, 'Director: generating Visual Bible (art style + color palette)...')
-        visual_bible = script.generate_visual_bible(script_data, style)
-        script_data['visual_bible'] = visual_bible
-        database.append_job_log(job_id, 'Director: Visual Bible complete.')
-
-        # Signal slide count + context_refs to the frontend for per-slide agent visualization
-        slide_count = len(script_data.get('slides', []))
-        refs_pairs = []
-        for i, slide in enumerate(script_data['slides']):
-            for ref in slide.get('context_refs', []):
-                refs_pairs.append(f'{i}>{ref}')
-        refs_part = ':' + ','.join(refs_pairs) if refs_pairs else ''
-        database.update_job_status(job_id, f'agent_director_slides_{slide_count}{refs_part}')
-        print(f"Job {job_id}: Director done — {slide_count} slides, refs={refs_pairs}, content_type={script_data.get('content_type','general')}")
-
-        # --- The Continuity Artist + Voice Over in parallel ---
-        # Images are generated sequentially (per-slide agent) while voice runs in parallel
-        database.append_job_log(job_id, f'Continuity Artist: generating {slide_count} images in batches of 3 (seed={session_seed})...')
-        database.append_job_log(job_id, 'Voice Over: starting TTS generation in parallel...')
-        print(f"Job {job_id}: Starting images (sequential) + voiceover (parallel)...")
-
-        def generate_images_task():
+    _log(ctx, 'Watchman: all services reachable. Environment OK.')
+    database.flush_job(job_id)
+
+    # --- The Director: script + global visual bible ---
+    database.update_job_status(job_id, 'agent_director_writing')
+    _log(ctx, f'Director: generating script for style="{style}"...')
+    print(f"Job {job_id}: Generating script...")
+    # with a streaming Director, each slide's narration goes to Polly as soon as the slide is
+    # complete; generate_voice_over later picks these up instead of synthesizing again
+    prefetched = {}
+    voice_prefetch = ThreadPoolExecutor(max_workers=12) if script.SCRIPT_STREAMING else None
+
+    def on_script_slide(i, slide):
+        if not prefetched:
+            _log(ctx, f'Director: first slide streamed at {clock.now():.1f}s, starting narration early.')
+        name = f'prefetch_{i}_{uuid.uuid4().hex[:8]}.mp3'
+        future = voice_prefetch.submit(voice_over.synthesize_slide, i, slide, os.path.join(temp_dir, name))
+        prefetched[i] = (slide['narration_prompt'], slide['voice_id'], name, future)
+
+    try:
+        with clock.stage('director'):
+            cache_key = script_cache.cache_key(prompt, style, script.GPT_MODEL, script.PROMPT_TEMPLATE_VERSION)
+            script_data = script_cache.lookup(cache_key)
+            if script_data:
+                _log(ctx, f'Director: script cache hit — {len(script_data.get("slides", []))} slides, content_type={script_data.get("content_type","general")}')
+            else:
+                script_data = script.generate_script(prompt, style, on_slide=on_script_slide if voice_prefetch else None)
+                _log(ctx, f'Director: script ready — {len(script_data.get("slides", []))} slides, content_type={script_data.get("content_type","general")}')
+                _log(ctx, 'Director: generating Visual Bible (art style + color palette)...')
+                visual_bible = script.generate_visual_bible(script_data, style)
+                script_data['visual_bible'] = visual_bible
+                # a failed visual bible comes back empty; don't pin that degraded output in the cache
+                if visual_bible:
+                    script_cache.store(cache_key, script_data)
+    finally:
+        if voice_prefetch:
+            voice_prefetch.shutdown(wait=True)
+    _log(ctx, 'Director: Visual Bible complete.')
+
+    # streamed narration is handed to the assets stage as files in the workspace
+    ctx['prefetched'] = {}
+    for i, (narration, voice_id, name, future) in prefetched.items():
+        try:
+            _, duration, _ = future.result()
+        except Exception as e:
+            print(f"Director: early narration for slide {i+1} failed ({e})")
+            continue
+        ctx['prefetched'][str(i)] = {'narration': narration, 'voice_id': voice_id, 'name': name, 'duration': duration}
+
+    # Signal slide count + context_refs to the frontend for per-slide agent visualization
+    slide_count = len(script_data.get('slides', []))
+    refs_pairs = []
+    for i, slide in enumerate(script_data['slides']):
+        for ref in slide.get('context_refs', []):
+            refs_pairs.append(f'{i}>{ref}')
+    refs_part = ':' + ','.join(refs_pairs) if refs_pairs else ''
+    database.update_job_status(job_id, f'agent_director_slides_{slide_count}{refs_part}')
+    database.flush_job(job_id)
+    print(f"Job {job_id}: Director done — {slide_count} slides, refs={refs_pairs}, content_type={script_data.get('content_type','general')}")
+
+    ctx['script'] = script_data
+    return ctx
+
+
+def run_assets(ctx, clock, temp_dir):
+    job_id, style, session_seed = ctx['id'], ctx['style'], ctx['session_seed']
+    script_data = ctx['script']
+    slide_count = len(script_data.get('slides', []))
+
+    # --- The Continuity Artist + Voice Over in parallel ---
+    # Images are generated concurrently under the AIMD limiter while voice runs in parallel.
+    # The slide scheduler encodes segment i as soon as image i and audio i both exist.
+    _log(ctx, f'Continuity Artist: generating {slide_count} images with adaptive concurrency (seed={session_seed})...')
+    _log(ctx, 'Voice Over: starting TTS generation in parallel...')
+    print(f"Job {job_id}: Starting images (adaptive concurrency) + voiceover (parallel)...")
+
+    engine = assemble.assembly_engine()
+    scheduler = SlideScheduler(job_id, temp_dir, slide_count, clock, encode=(engine == 'segments' and EARLY_ENCODE),
+                               workers=assemble.segment_workers())
+
+    prefetched = {}
+    for i, entry in ctx.get('prefetched', {}).items():
+        done = Future()
+        done.set_result((os.path.join(temp_dir, entry['name']), entry['duration'], None))
+        prefetched[int(i)] = (entry['narration'], entry['voice_id'], done)
+
+    def generate_images_task():
+        with clock.stage('images'):
             return image_generation.generate_images(
                 script_data, job_id, style, temp_dir, session_seed,
-                status_callback=lambda s: database.update_job_status(job_id, s)
+                status_callback=lambda s: database.update_job_status(job_id, s),
+                on_image=scheduler.image_ready,
+                image_sink=scheduler.image_sink
             )
 
-        def generate_voiceover_task():
-            return voice_over.generate_voice_over(script_data, job_id, temp_dir, style)
+    def generate_voiceover_task():
+        with clock.stage('voice'):
+            return voice_over.generate_voice_over(
+                script_data, job_id, temp_dir, style,
+                on_slide=scheduler.audio_ready,
+                prefetched=prefetched
+            )
 
+    try:
         with ThreadPoolExecutor(max_workers=2) as executor:
             future_images = executor.submit(generate_images_task)
             future_voice = executor.submit(generate_voiceover_task)
             image_paths = future_images.result()
-            audio_path, measured_timings = future_voice.result()
+            audio_path, measured_timings, tts = future_voice.result()
+        generation_end = clock.now()
+    finally:
+        scheduler.finish()
+
+    script_data['timings'] = measured_timings
+    _log(ctx, f'Continuity Artist: all {slide_count} images generated.')
+    _log(ctx, 'Voice Over: audio complete.')
+    _log(ctx, f"Voice Over: TTS cache {tts['cache_hits']} hits, {tts['synthesized']} synthesized, "
+              f"{tts['prefetched']} narrated while the script streamed.")
+    print(f"Job {job_id}: Parallel generation complete!")
+    for line in scheduler.timeline_lines():
+        _log(ctx, f'Scheduler: {line}')
+    _log(ctx, f'Scheduler: {scheduler.overlap_seconds(generation_end):.1f}s of segment encoding overlapped with generation.')
+    database.flush_job(job_id)
 
-        script_data['timings'] = measured_timings
-        database.append_job_log(job_id, f'Continuity Artist: all {slide_count} images generated.')
-        database.append_job_log(job_id, 'Voice Over: audio complete.')
-        print(f"Job {job_id}: Parallel generation complete!")
+    # pre-encoded segments travel with their content key, so the assemble stage (possibly on
+    # another node) reuses one only if its image and duration are unchanged after the audit
+    segments = []
+    for i, segment_path in enumerate(scheduler.segments_for(image_paths, measured_timings)):
+        if segment_path:
+            key = assemble.segment_cache_key(image_paths[i], measured_timings[i])
+            segments.append({'name': os.path.basename(segment_path), 'key': key})
+        else:
+            segments.append(None)
 
-        # --- The Auditor: validate outputs, retry up to MAX_RETRIES ---
-        database.update_job_status(job_id, 'agent_auditor_checking')
-        database.append_job_log(job_id, 'Auditor: validating images and audio...')
-        print(f"Job {job_id}: Auditor checking outputs...")
+    ctx['images'] = [os.path.basename(p) for p in image_paths]
+    ctx['audio'] = os.path.basename(audio_path)
+    ctx['segments'] = segments
+    ctx['prefetched'] = {}
+    return ctx
 
+
+def run_audit(ctx, clock, temp_dir):
+    job_id, style, session_seed = ctx['id'], ctx['style'], ctx['session_seed']
+    script_data = ctx['script']
+    slide_count = len(script_data.get('slides', []))
+    image_paths = _paths(ctx, ctx['images'])
+    audio_path = workspace.path(job_id, ctx['audio'])
+
+    # --- The Auditor: validate outputs, retry up to MAX_RETRIES ---
+    database.update_job_status(job_id, 'agent_auditor_checking')
+    _log(ctx, 'Auditor: validating images and audio...')
+    print(f"Job {job_id}: Auditor checking outputs...")
+
+    with clock.stage('audit'):
         failed_images = auditor.validate_images(image_paths)
         for attempt in range(1, MAX_RETRIES):
             if not failed_images:
                 break
-            database.append_job_log(job_id, f'Auditor: image validation failed (slides {failed_images}), retry {attempt}/{MAX_RETRIES - 1}...')
-            print(f"Auditor: image retry {attempt}/{MAX_RETRIES - 1}...")
+            _log(ctx, f'Auditor: image validation failed (slides {failed_images}), retry {attempt}/{MAX_RETRIES - 1} for those slides only...')
+            print(f"Auditor: image retry {attempt}/{MAX_RETRIES - 1} for slides {failed_images}...")
+            metrics.retry('audit_images')
             database.update_job_status(job_id, 'agent_auditor_retry')
-            image_paths = image_generation.generate_images(script_data, job_id, style, temp_dir, session_seed)
+            image_paths = image_generation.generate_images(script_data, job_id, style, temp_dir, session_seed, indices=failed_images)
             failed_images = auditor.validate_images(image_paths)
 
         if failed_images:
             raise Exception(f"Images failed validation after {MAX_RETRIES} attempts: slides {failed_images}")
 
-        audio_valid = auditor.validate_audio(audio_path)
+        # per-slide audio first, so a retry re-synthesizes only the broken slides; an
+        # invalid concat with every slide intact is rebuilt without calling Polly
+        slide_audio = [voice_over.slide_audio_path(temp_dir, i) for i in range(slide_count)]
+        failed_audio = auditor.validate_slide_audio(slide_audio)
+        audio_valid = not failed_audio and auditor.validate_audio(audio_path)
         for attempt in range(1, MAX_RETRIES):
             if audio_valid:
                 break
-            database.append_job_log(job_id, f'Auditor: audio validation failed, retry {attempt}/{MAX_RETRIES - 1}...')
-            print(f"Auditor: audio retry {attempt}/{MAX_RETRIES - 1}...")
+            _log(ctx, f'Auditor: audio validation failed (slides {failed_audio}), retry {attempt}/{MAX_RETRIES - 1}...')
+            print(f"Auditor: audio retry {attempt}/{MAX_RETRIES - 1} for slides {failed_audio}...")
+            metrics.retry('audit_audio')
             database.update_job_status(job_id, 'agent_auditor_retry')
-            audio_path, measured_timings = voice_over.generate_voice_over(script_data, job_id, temp_dir, style)
+            audio_path, measured_timings, _ = voice_over.generate_voice_over(
+                script_data, job_id, temp_dir, style,
+                indices=failed_audio, durations=script_data['timings']
+            )
             script_data['timings'] = measured_timings
-            audio_valid = auditor.validate_audio(audio_path)
+            failed_audio = auditor.validate_slide_audio(slide_audio)
+            audio_valid = not failed_audio and auditor.validate_audio(audio_path)
 
         if not audio_valid:
             raise Exception(f"Audio failed validation after {MAX_RETRIES} attempts")
 
-        database.append_job_log(job_id, 'Auditor: all outputs valid.')
+    _log(ctx, 'Auditor: all outputs valid.')
+    database.flush_job(job_id)
+
+    ctx['images'] = [os.path.basename(p) for p in image_paths]
+    ctx['audio'] = os.path.basename(audio_path)
+    return ctx
 
-        # --- Assemble ---
-        database.update_job_status(job_id, 'agent_stitching')
-        database.append_job_log(job_id, f'Editor: stitching {slide_count} segments with FFmpeg...')
-        print(f"Job {job_id}: Assembling video...")
-        video_path = assemble.stitch_video(image_paths, audio_path, script_data['timings'], job_id, temp_dir)
 
-        if not auditor.validate_video(video_path):
+def run_assemble(ctx, clock, temp_dir):
+    job_id = ctx['id']
+    script_data = ctx['script']
+    slide_count = len(script_data.get('slides', []))
+    image_paths = _paths(ctx, ctx['images'])
+    audio_path = workspace.path(job_id, ctx['audio'])
+    timings = script_data['timings']
+
+    # --- Assemble ---
+    database.update_job_status(job_id, 'agent_stitching')
+    _log(ctx, f'Editor: stitching {slide_count} segments with FFmpeg...')
+    print(f"Job {job_id}: Assembling video...")
+    engine = assemble.assembly_engine()
+    with clock.stage('assemble'):
+        prebuilt = []
+        for i, entry in enumerate(ctx.get('segments') or [None] * slide_count):
+            segment_path = workspace.path(job_id, entry['name']) if entry else None
+            fresh = (segment_path and os.path.exists(segment_path)
+                     and entry['key'] == assemble.segment_cache_key(image_paths[i], timings[i]))
+            prebuilt.append(segment_path if fresh else None)
+        if engine == 'segments':
+            reused = sum(1 for p in prebuilt if p)
+            _log(ctx, f'Editor: {reused}/{slide_count} segments pre-encoded by the scheduler.')
+        else:
+            _log(ctx, f'Editor: assembling in a single FFmpeg pass (engine={engine}).')
+        video_path = assemble.stitch_video(
+            image_paths, audio_path, timings, job_id, temp_dir,
+            segment_paths=prebuilt, engine=engine,
+            log=lambda m: _log(ctx, m)
+        )
+
+        if not auditor.validate_video(video_path, expected_duration=sum(timings)):
             raise Exception("Final video failed auditor validation")
 
-        # clean up temp segments only after auditor confirms the final video is valid
-        for f in os.listdir(temp_dir):
-            if f.startswith('segment_') and f.endswith('.mp4'):
-                os.remove(os.path.join(temp_dir, f))
-        database.append_job_log(job_id, 'Editor: video assembled and validated. Temp segments cleaned.')
-        print("Auditor: temporary segments cleaned up")
+    # clean up temp segments only after auditor confirms the final video is valid
+    for f in os.listdir(temp_dir):
+        if f.startswith('segment_') and f.endswith('.mp4'):
+            os.remove(os.path.join(temp_dir, f))
+    _log(ctx, 'Editor: video assembled and validated. Temp segments cleaned.')
+    print("Auditor: temporary segments cleaned up")
+    database.flush_job(job_id)
 
-        # --- Upload ---
-        database.update_job_status(job_id, 'agent_uploading')
-        database.append_job_log(job_id, 'Uploading video and thumbnail to Cloudflare R2...')
-        print(f"Job {job_id}: Uploading to Cloudflare R2...")
-        video_url, thumbnail_url = storage.upload_files(job_id, video_path, temp_dir)
+    ctx['segments'] = []
+    ctx['video'] = os.path.basename(video_path)
+    return ctx
 
-        # --- Complete ---
-        database.update_job_completed(job_id, video_url, thumbnail_url)
-        database.append_job_log(job_id, f'Done! Video available at: {video_url}')
-        print(f"Job {job_id} completed successfully!")
 
-        try:
-            shutil.rmtree(temp_dir)
-            print(f"Cleaned up temp directory: {temp_dir}")
-        except Exception as e:
-            print(f"Warning: could not clean up temp dir: {e}")
+def run_upload(ctx, clock, temp_dir):
+    job_id = ctx['id']
+
+    # --- Upload ---
+    database.update_job_status(job_id, 'agent_uploading')
+    _log(ctx, 'Uploading video and thumbnail to Cloudflare R2...')
+    print(f"Job {job_id}: Uploading to Cloudflare R2...")
+    with clock.stage('upload'):
+        video_url, thumbnail_url, derivative_urls = storage.upload_files(
+            job_id, workspace.path(job_id, ctx['video']), temp_dir,
+            log=lambda m: _log(ctx, m),
+            image_paths=_paths(ctx, ctx['images'])
+        )
 
-        return {
-            'status': 'success',
-            'job_id': job_id,
-            'video_url': video_url,
-            'thumbnail_url': thumbnail_url
-        }
+    # --- Complete ---
+    database.update_job_completed(job_id, video_url, thumbnail_url, **derivative_urls)
+    _log(ctx, f'Timings: {clock.summary()} | total {clock.now():.1f}s')
+    _log(ctx, f'Done! Video available at: {video_url}')
+    database.flush_job(job_id)
+    print(f"Job {job_id} completed successfully!")
+    metrics.job_finished('completed')
 
+    workspace.cleanup(job_id, ctx.get('artifacts'))
+
+    ctx['video_url'] = video_url
+    ctx['thumbnail_url'] = thumbnail_url
+    ctx.update(derivative_urls)
+    return ctx
+
+
+STAGES = (
+    ('director', run_director),
+    ('assets', run_assets),
+    ('audit', run_audit),
+    ('assemble', run_assemble),
+    ('upload', run_upload),
+)
+
+
+def _fail(ctx, clock, error):
+    job_id = ctx['id']
+    print(f"Job {job_id} failed with error: {str(error)}")
+    database.append_job_log(job_id, f'Timings: {clock.summary()} | failed at {clock.now():.1f}s')
+    database.append_job_log(job_id, f'FAILED: {str(error)}')
+    database.update_job_status(job_id, 'failed')
+    metrics.job_finished('failed')
+    # a failed job is final (time-limit retries don't come through here), so drop its files
+    # and make sure a re-sent copy of it doesn't start over
+    checkpoint.mark_failed(job_id)
+    workspace.cleanup(job_id, ctx.get('artifacts'))
+
+
+def _run_stage(ctx, name, fn):
+    """Run one stage against the shared workspace and checkpoint its output; marks the job
+    failed if it raises (except on the soft time limit, where the task retries and resumes)"""
+    job_id = ctx['id']
+    clock = JobClock.from_dict(ctx.get('clock'))
+    temp_dir = workspace.job_dir(job_id)
+    ctx.setdefault('artifacts', {})
+    try:
+        workspace.fetch(job_id, _artifact_names(ctx), ctx['artifacts'])
+        ctx = fn(ctx, clock, temp_dir)
+        ctx['clock'] = clock.to_dict()
+        if name != 'upload':
+            workspace.publish(job_id, _artifact_names(ctx), ctx['artifacts'])
+        checkpoint.save(job_id, name, ctx)
+        return ctx
+    except SoftTimeLimitExceeded:
+        ctx['clock'] = clock.to_dict()
+        raise
     except Exception as e:
-        print(f"Job {job_id} failed with error: {str(e)}")
-        database.append_job_log(job_id, f'FAILED: {str(e)}')
-        database.update_job_status(job_id, 'failed')
-        raise e
+        _fail(ctx, clock, e)
+        raise
+
+
+def _retry_or_fail(task, ctx, error, attempt):
+    """Soft time limit hit: retry the task (it resumes from the manifest) or give up; attempts
+    are counted by checkpoint.start_attempt, which every run of the task goes through"""
+    if attempt < checkpoint.JOB_MAX_ATTEMPTS:
+        _log(ctx, f'Checkpoint: time limit reached, resuming from the last finished stage (attempt {attempt + 1}/{checkpoint.JOB_MAX_ATTEMPTS})...')
+        database.flush_job(ctx['id'])
+        metrics.retry('time_limit')
+        raise task.retry(exc=error, countdown=5, max_retries=None)
+    _fail(ctx, JobClock.from_dict(ctx.get('clock')), Exception(f'time limit exceeded {checkpoint.JOB_MAX_ATTEMPTS} times'))
+    raise error
+
+
+def _resume_point(ctx):
+    """(ctx, remaining stages) from the job's manifest; starts over if its artifacts are gone"""
+    manifest = checkpoint.load(ctx['id'])
+    if not manifest or not manifest.get('completed'):
+        return ctx, list(STAGES)
+    saved = manifest['ctx']
+    if 'upload' in manifest['completed']:  # finished; the workspace is already cleaned up
+        return saved, []
+    names = _artifact_names(saved)
+    missing = [n for n in names if not os.path.exists(workspace.path(ctx['id'], n))
+               and not (workspace.WORKSPACE_BACKEND == 'r2' and n in saved.get('artifacts', {}))]
+    if missing:
+        _log(ctx, f'Checkpoint: {len(missing)} artifacts from the last run are gone, starting over.')
+        checkpoint.reset(ctx['id'])
+        return ctx, list(STAGES)
+    remaining = [(name, fn) for name, fn in STAGES if name not in manifest['completed']]
+    done = ', '.join(manifest['completed'])
+    _log(ctx, f'Checkpoint: resuming after {done} — skipping {len(STAGES) - len(remaining)} finished stages.')
+    print(f"Job {ctx['id']}: resuming from checkpoint ({done})")
+    return saved, remaining
+
+
+def _result(ctx):
+    return {
+        'status': 'success',
+        'job_id': ctx['id'],
+        'video_url': ctx['video_url'],
+        'thumbnail_url': ctx['thumbnail_url'],
+        'preview_url': ctx.get('preview_url'),
+        'sprite_url': ctx.get('sprite_url'),
+    }
+
+
+def _wait_for_lock(task, job_id):
+    # another copy of the job is running; by the time this comes back round it has either
+    # finished (and the manifest says so) or died and let its lease lapse
+    print(f"Job {job_id}: already running in another task, retrying in {checkpoint.JOB_LOCK_TTL}s")
+    return task.retry(countdown=checkpoint.JOB_LOCK_TTL, max_retries=None)
+
+def _stage_task(task, ctx, name, fn):
+    with checkpoint.job_lock(ctx['id']) as held:
+        if not held:
+            raise _wait_for_lock(task, ctx['id'])
+        # a redelivered stage that already finished hands on its checkpointed output
+        manifest = checkpoint.load(ctx['id'])
+        if manifest and manifest.get('failed'):
+            raise Exception(f"job {ctx['id']} has already failed")
+        if manifest and name in manifest.get('completed', []):
+            print(f"Job {ctx['id']}: stage {name} already finished, using checkpoint")
+            return manifest['ctx']
+        # a stage that keeps killing its worker must not be redelivered forever either
+        attempt = checkpoint.start_attempt(ctx['id'], name)
+        if attempt > checkpoint.JOB_MAX_ATTEMPTS:
+            error = Exception(f'gave up on {name} after {attempt - 1} attempts')
+            _fail(ctx, JobClock.from_dict(ctx.get('clock')), error)
+            raise error
+        try:
+            return _run_stage(ctx, name, fn)
+        except SoftTimeLimitExceeded as e:
+            _retry_or_fail(task, ctx, e, attempt)
+
+
+@app.task(bind=True, name='orchestrator.stage_director')
+def stage_director(self, ctx):
+    return _stage_task(self, ctx, 'director', run_director)
+
+@app.task(bind=True, name='orchestrator.stage_assets')
+def stage_assets(self, ctx):
+    return _stage_task(self, ctx, 'assets', run_assets)
+
+@app.task(bind=True, name='orchestrator.stage_audit')
+def stage_audit(self, ctx):
+    return _stage_task(self, ctx, 'audit', run_audit)
+
+@app.task(bind=True, name='orchestrator.stage_assemble')
+def stage_assemble(self, ctx):
+    return _stage_task(self, ctx, 'assemble', run_assemble)
+
+@app.task(bind=True, name='orchestrator.stage_upload')
+def stage_upload(self, ctx):
+    return _result(_stage_task(self, ctx, 'upload', run_upload))
+
+STAGE_TASKS = {
+    'director': stage_director,
+    'assets': stage_assets,
+    'audit': stage_audit,
+    'assemble': stage_assemble,
+    'upload': stage_upload,
+}
+
+
+@app.task(bind=True)
+def process_video_job(self, job_data):
+    """
+    Main task that processes a video generation job
+    Takes job_data dict with: { id, prompt, style }
+    Retried and redelivered runs resume after the last stage recorded in the job's manifest;
+    a copy sent while the job is still running waits for the job's lease (see checkpoint.py).
+    """
+    started = time.monotonic()
+    with checkpoint.job_lock(job_data['id']) as held:
+        if not held:
+            raise _wait_for_lock(self, job_data['id'])
+        outcome = _start_job(self, job_data, started)
+    if isinstance(outcome, list):
+        # dispatched after the lease is released, so the first stage doesn't find it taken
+        result = chain(*outcome).apply_async()
+        print(f"Job {job_data['id']}: dispatched as chained stage tasks ({result.id})")
+        return {'status': 'dispatched', 'job_id': job_data['id'], 'chain_id': result.id}
+    return outcome
+
+
+def _start_job(task, job_data, started):
+    """Run the job inline (returns its result) or, in chain mode, return the stage signatures
+    still to run; called holding the job's lease"""
+    manifest = checkpoint.load(job_data['id'])
+    if manifest and manifest.get('failed'):
+        print(f"Job {job_data['id']}: already failed, not running it again")
+        return {'status': 'failed', 'job_id': job_data['id']}
+    # enqueued_at is stamped by the API; the wait covers the intake queue and the Celery list
+    enqueued_at = job_data.get('enqueued_at')
+    waited = max(0.0, time.time() - float(enqueued_at)) if enqueued_at else None
+    ctx = {
+        'id': job_data['id'],
+        'prompt': job_data['prompt'],
+        'style': job_data.get('style', 'Default'),
+        'session_seed': random.randint(1, 2147483647),
+        'clock': JobClock(stages={'queue': (-waited, 0.0)} if waited is not None else None).to_dict(),
+    }
+    ctx, remaining = _resume_point(ctx)
+    if not remaining:
+        return _result(ctx)
+
+    # a job that keeps killing its worker must not be redelivered forever
+    attempt = checkpoint.start_attempt(ctx['id'])
+    if attempt > checkpoint.JOB_MAX_ATTEMPTS:
+        _fail(ctx, JobClock.from_dict(ctx['clock']), Exception(f'gave up after {attempt - 1} attempts'))
+        return {'status': 'failed', 'job_id': ctx['id']}
+    if attempt == 1 and waited is not None:
+        intake.record_wait(job_data.get('tier', 'standard'), waited)
+        metrics.queue_wait(job_data.get('tier', 'standard'), waited)
+        _log(ctx, f'Intake: started after {waited:.1f}s in queue.')
+    print(f"Created job temp directory: {workspace.job_dir(ctx['id'])}")
+
+    if PIPELINE_MODE == 'chain':
+        first_name = remaining[0][0]
+        print(f"Job {ctx['id']}: resuming chained stages from {first_name}")
+        return [STAGE_TASKS[first_name].s(ctx)] + [STAGE_TASKS[name].s() for name, _ in remaining[1:]]
+
+    # the threads pool never raises SoftTimeLimitExceeded, so check the soft limit between
+    # stages too: an overrunning job goes back on the queue and resumes from its checkpoint
+    soft_limit = app.conf.task_soft_time_limit
+    try:
+        for i, (name, fn) in enumerate(remaining):
+            if i and soft_limit and time.monotonic() - started > soft_limit:
+                raise SoftTimeLimitExceeded()
+            ctx = _run_stage(ctx, name, fn)
+    except SoftTimeLimitExceeded as e:
+        _retry_or_fail(task, ctx, e, attempt)
+    return _result(ctx)
@@ -0,0 +1,39 @@
+# Publishes every job status transition and log line to Redis, next to the durable Postgres
+# writes, so status/log readers can subscribe (pub/sub) or read incrementally (stream)
+# instead of polling the primary database.
+#   stream:  keyframe:job:<id>:events  (XADD, capped, expires after PROGRESS_TTL)
+#   channel: keyframe:job:<id>         (PUBLISH, same JSON payload)
+import os
+import json
+import time
+import redis_client
+
+PROGRESS_REDIS = os.getenv('PROGRESS_REDIS', '1') == '1'
+PROGRESS_STREAM_MAXLEN = int(os.getenv('PROGRESS_STREAM_MAXLEN', '2000'))
+PROGRESS_TTL = int(os.getenv('PROGRESS_TTL', '86400'))
+
+_last_error_at = 0.0
+
+def stream_key(job_id):
+    return f'keyframe:job:{job_id}:events'
+
+def channel(job_id):
+    return f'keyframe:job:{job_id}'
+
+def publish(job_id, kind, value):
+    """kind is 'status' or 'log'; never raises — Postgres stays the source of truth"""
+    global _last_error_at
+    if not PROGRESS_REDIS:
+        return
+    event = {'type': kind, 'value': value, 'ts': f'{time.time():.3f}'}
+    try:
+        pipe = redis_client.get_client().pipeline(transaction=False)
+        pipe.xadd(stream_key(job_id), event, maxlen=PROGRESS_STREAM_MAXLEN, approximate=True)
+        pipe.expire(stream_key(job_id), PROGRESS_TTL)
+        pipe.publish(channel(job_id), json.dumps(event))
+        pipe.execute()
+    except Exception as e:
+        # at most one warning a minute so a Redis outage doesn't flood the worker log
+        if time.time() - _last_error_at > 60:
+            _last_error_at = time.time()
+            print(f"Progress: could not publish to Redis ({e})")
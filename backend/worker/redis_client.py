@@ -0,0 +1,22 @@
+# Lazily-created Redis client shared by worker-side caches and indexes (same REDIS_URL as Celery)
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_client = None
+_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import redis
+                _client = redis.Redis.from_url(
+                    os.getenv('REDIS_URL', 'redis://localhost:6379'),
+                    socket_timeout=5,
+                    socket_connect_timeout=5,
+                )
+    return _client
@@ -0,0 +1,204 @@
+# Per-slide dependency scheduler: segment i is encoded as soon as image i and audio i exist,
+# so FFmpeg work overlaps with Replicate/Polly latency instead of waiting for every asset.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import assemble
+import auditor
+
+# tee image downloads straight into an already-running segment encoder when the slide's
+# audio finished first (the usual case: Polly is faster than Replicate)
+PIPE_TO_ENCODER = os.getenv('IMAGE_PIPE_TO_ENCODER') == '1'
+
+
+def _stamp(path):
+    """Identity of a file on disk — changes when the auditor regenerates it in place"""
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+class _EncoderSink:
+    """Write side handed to image_generation; never raises into the download loop"""
+
+    def __init__(self, scheduler, i, encoder, duration, started):
+        self.scheduler = scheduler
+        self.i = i
+        self.encoder = encoder
+        self.duration = duration
+        self.started = started
+        self.broken = False
+
+    def write(self, chunk):
+        if self.broken:
+            return
+        try:
+            self.encoder.write(chunk)
+        except OSError as e:
+            print(f"Scheduler: slide {self.i+1} encoder pipe closed early ({e})")
+            self.broken = True
+
+    def close(self):
+        # the encoder is awaited on the scheduler pool once image_ready() arrives
+        pass
+
+    def abort(self):
+        self.encoder.abort()
+        self.scheduler._pipe_aborted(self.i)
+
+
+class SlideScheduler:
+
+    def __init__(self, job_id, temp_dir, slide_count, clock, workers=1, encode=True):
+        self.job_id = job_id
+        self.temp_dir = temp_dir
+        self.slide_count = slide_count
+        self.clock = clock
+        self.encode = encode  # False records the timeline only (e.g. filtergraph assembly)
+        self._images = {}
+        self._audio = {}
+        self._segments = {}   # i -> (segment_path, image_path, image_stamp, duration)
+        self._timeline = {}   # i -> {'image': t, 'audio': t, 'encode': (start, end)}
+        self._submitted = set()
+        self._pipes = {}      # i -> _EncoderSink fed by the image download
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._futures = []
+
+    # --- callbacks from the image and voice threads (must never raise) ---
+
+    def image_sink(self, i):
+        """Called by the image thread right before it downloads image i"""
+        if not (self.encode and PIPE_TO_ENCODER):
+            return None
+        with self._lock:
+            if i in self._submitted or i not in self._audio:
+                return None
+            audio_path, duration = self._audio[i]
+            segment_path = os.path.join(self.temp_dir, f'segment_{i}.mp4')
+            try:
+                encoder = assemble.PipedSegmentEncoder(duration, segment_path)
+            except Exception as e:
+                print(f"Scheduler: slide {i+1} could not start piped encoder ({e})")
+                return None
+            self._submitted.add(i)
+            sink = _EncoderSink(self, i, encoder, duration, self.clock.now())
+            self._pipes[i] = sink
+            return sink
+
+    def _pipe_aborted(self, i):
+        with self._lock:
+            self._pipes.pop(i, None)
+            self._submitted.discard(i)
+
+    def image_ready(self, i, image_path):
+        with self._lock:
+            self._images[i] = image_path
+            self._timeline.setdefault(i, {})['image'] = self.clock.now()
+            sink = self._pipes.pop(i, None)
+            if sink:
+                audio_path, _ = self._audio[i]
+                self._futures.append(self._pool.submit(self._finish_piped, i, sink, image_path, audio_path))
+        if not sink:
+            self._maybe_submit(i)
+
+    def audio_ready(self, i, audio_path, duration):
+        with self._lock:
+            self._audio[i] = (audio_path, duration)
+            self._timeline.setdefault(i, {})['audio'] = self.clock.now()
+        self._maybe_submit(i)
+
+    def _maybe_submit(self, i):
+        with self._lock:
+            if not self.encode or i in self._submitted or i not in self._images or i not in self._audio:
+                return
+            self._submitted.add(i)
+            image_path = self._images[i]
+            audio_path, duration = self._audio[i]
+            self._futures.append(self._pool.submit(self._encode, i, image_path, audio_path, duration))
+
+    def _encode(self, i, image_path, audio_path, duration):
+        try:
+            if auditor.validate_images([image_path]) or not auditor.validate_audio(audio_path):
+                print(f"Scheduler: slide {i+1} failed validation, leaving it for the auditor")
+                return
+            stamp = _stamp(image_path)
+            segment_path = os.path.join(self.temp_dir, f'segment_{i}.mp4')
+            start = self.clock.now()
+            assemble.encode_segment(image_path, duration, segment_path)
+            end = self.clock.now()
+            with self._lock:
+                self._segments[i] = (segment_path, image_path, stamp, duration)
+                self._timeline.setdefault(i, {})['encode'] = (start, end)
+            print(f"Scheduler: slide {i+1} segment encoded in {end - start:.2f}s")
+        except Exception as e:
+            print(f"Scheduler: slide {i+1} early encode failed ({e}), will re-encode at assembly")
+
+    def _finish_piped(self, i, sink, image_path, audio_path):
+        try:
+            if sink.broken:
+                sink.encoder.abort()
+                raise Exception('encoder pipe broke during download')
+            sink.encoder.finish()
+            end = self.clock.now()
+            if auditor.validate_images([image_path]) or not auditor.validate_audio(audio_path):
+                print(f"Scheduler: slide {i+1} failed validation, leaving it for the auditor")
+                return
+            with self._lock:
+                self._segments[i] = (sink.encoder.segment_path, image_path, _stamp(image_path), sink.duration)
+                self._timeline.setdefault(i, {})['encode'] = (sink.started, end)
+            if assemble.segment_cache.enabled:
+                assemble.segment_cache.put(assemble.segment_cache_key(image_path, sink.duration), '.mp4', sink.encoder.segment_path)
+            print(f"Scheduler: slide {i+1} segment encoded from the download stream ({end - sink.started:.2f}s)")
+        except Exception as e:
+            print(f"Scheduler: slide {i+1} piped encode failed ({e}), encoding from file")
+            self._encode(i, image_path, audio_path, sink.duration)
+
+    # --- called by the orchestrator ---
+
+    def finish(self):
+        """Wait for in-flight encodes and stop accepting work"""
+        for future in list(self._futures):
+            future.result()
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            leftover = list(self._pipes.values())
+            self._pipes.clear()
+        for sink in leftover:
+            sink.encoder.abort()
+
+    def segments_for(self, image_paths, timings):
+        """Pre-encoded segment paths still matching the final images/timings, None where stale"""
+        result = []
+        with self._lock:
+            for i, (image_path, duration) in enumerate(zip(image_paths, timings)):
+                entry = self._segments.get(i)
+                if entry and entry[1] == image_path and entry[2] == _stamp(image_path) and entry[3] == duration:
+                    result.append(entry[0])
+                else:
+                    result.append(None)
+        return result
+
+    def timeline_lines(self):
+        """Per-slide timing lines for the job log"""
+        lines = []
+        with self._lock:
+            for i in range(self.slide_count):
+                t = self._timeline.get(i, {})
+                image = f"{t['image']:.1f}s" if 'image' in t else '-'
+                audio = f"{t['audio']:.1f}s" if 'audio' in t else '-'
+                encode = f"{t['encode'][0]:.1f}-{t['encode'][1]:.1f}s" if 'encode' in t else 'deferred'
+                lines.append(f"slide {i+1}: image@{image} audio@{audio} encode {encode}")
+        return lines
+
+    def overlap_seconds(self, generation_end):
+        """Encode time that finished before generation ended (i.e. hidden behind provider latency)"""
+        hidden = 0.0
+        with self._lock:
+            for t in self._timeline.values():
+                if 'encode' in t:
+                    start, end = t['encode']
+                    hidden += max(0.0, min(end, generation_end) - start)
+        return hidden
@@ -1,9 +1,17 @@
 import os
+import re
 import json
+import copy
 from openai import OpenAI
+import metrics
 
 openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 GPT_MODEL = "gpt-4o-mini"
+# bump whenever the script or visual bible prompts change, so cached Director output is not reused
+PROMPT_TEMPLATE_VERSION = 1
+# stream the script completion and hand each slide downstream as soon as it is complete
+SCRIPT_STREAMING = os.getenv('SCRIPT_STREAMING', '0') == '1'
+MIN_SLIDES = 10
 
 AVAILABLE_VOICES = ['Ruth', 'Matthew', 'Brian', 'Amy', 'Joanna', 'Danielle']
 VALID_CONTENT_TYPES = {'educational', 'narrative', 'humorous', 'general'}
@@ -39,8 +47,147 @@ def _to_str(val) -> str:
     return str(val)
 
 
+def _normalize_slide(slide, i):
+    """Coerce one slide in place; raises ValueError if a required field is missing."""
+    # coerce required string fields
+    narration = _to_str(slide.get('narration_prompt', ''))
+    if not narration:
+        raise ValueError(f"Slide {i+1} missing narration_prompt")
+    slide['narration_prompt'] = narration
+
+    image_prompt = _to_str(slide.get('image_prompt', ''))
+    if not image_prompt:
+        raise ValueError(f"Slide {i+1} missing image_prompt")
+    slide['image_prompt'] = image_prompt
+
+    # coerce duration to int
+    try:
+        slide['duration'] = int(float(slide.get('duration') or 8))
+    except (TypeError, ValueError):
+        slide['duration'] = 8
+
+    # validate voice_id
+    if not slide.get('voice_id') or slide['voice_id'] not in AVAILABLE_VOICES:
+        slide['voice_id'] = 'Matthew'
+
+    # validate context_refs — integers only, back-references only
+    raw_refs = slide.get('context_refs', [])
+    coerced = []
+    for r in raw_refs if isinstance(raw_refs, list) else []:
+        try:
+            idx = int(r)
+            if 0 <= idx < i:
+                coerced.append(idx)
+        except (TypeError, ValueError):
+            pass
+    slide['context_refs'] = coerced
+    return slide
+
+
+class SlideStreamParser:
+    """Incremental parser for the "slides" array of a streamed script: feed() text deltas and
+    get back each slide object as soon as its closing brace arrives (None if it didn't parse)."""
+
+    _SLIDES_START = re.compile(r'"slides"\s*:\s*\[')
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.in_slides = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.obj_start = None
+
+    def feed(self, text):
+        self.buffer += text
+        slides = []
+        if self.done:
+            return slides
+        if not self.in_slides:
+            match = self._SLIDES_START.search(self.buffer)
+            if not match:
+                return slides
+            self.in_slides = True
+            self.pos = match.end()
+        buf = self.buffer
+        while self.pos < len(buf):
+            ch = buf[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == '{':
+                if self.depth == 0:
+                    self.obj_start = self.pos
+                self.depth += 1
+            elif ch == '}':
+                self.depth -= 1
+                if self.depth == 0 and self.obj_start is not None:
+                    try:
+                        slides.append(json.loads(buf[self.obj_start:self.pos + 1]))
+                    except json.JSONDecodeError:
+                        slides.append(None)  # keeps indices aligned; the final parse decides
+                    self.obj_start = None
+            elif ch == ']' and self.depth == 0:
+                self.done = True
+                self.pos += 1
+                break
+            self.pos += 1
+        return slides
+
+
+def _stream_completion(messages, on_slide):
+    """Stream the script completion, calling on_slide(i, slide) for every complete, valid slide.
+    Returns the full text for the usual end-of-stream parse and validation."""
+    stream = openai_client.chat.completions.create(
+        model=GPT_MODEL,
+        messages=messages,
+        response_format={"type": "json_object"},
+        temperature=0.8,
+        max_tokens=4000,
+        timeout=90,
+        stream=True
+    )
+    parser = SlideStreamParser()
+    parts = []
+    emitted = 0
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        parts.append(delta)
+        for slide in parser.feed(delta):
+            i = emitted
+            emitted += 1
+            if slide is None:
+                continue
+            try:
+                slide = _normalize_slide(copy.deepcopy(slide), i)
+            except ValueError as e:
+                print(f"Director stream: {e}, not handed downstream")
+                continue
+            print(f"Director stream: slide {i+1} complete")
+            try:
+                on_slide(i, slide)
+            except Exception as e:
+                print(f"Director stream: on_slide({i}) failed ({e})")
+    return ''.join(parts)
+
+
 #the main script generation method — style is now auto-detected from the prompt
-def generate_script(prompt, style=None):
+def generate_script(prompt, style=None, on_slide=None):
+    """With SCRIPT_STREAMING=1 and an on_slide callback, slides are handed over while the
+    completion streams; the returned script is still validated as a whole (MIN_SLIDES,
+    context_refs), and a retry re-emits slides from index 0."""
     print("Beginning script generation...\n\n")
 
     system_prompt = f"""You are a viral content creator specializing in short-form video. Analyze the prompt and create a complete, engaging video script targeting 60–75 seconds total runtime.
@@ -98,29 +245,36 @@ Return JSON matching this schema exactly:
 }}"""
 
     try:
-        MIN_SLIDES = 10
         script_json = None
 
         for attempt in range(1, 4):
             print(f"1. Calling GPT (attempt {attempt}/3)...")
+            if attempt > 1:
+                metrics.retry('script')
             user_msg = f"Create a video about: {prompt}"
             if attempt > 1:
                 user_msg += f" IMPORTANT: You must generate exactly {MIN_SLIDES} slides minimum. Previous attempt had too few slides."
 
-            response = openai_client.chat.completions.create(
-                model=GPT_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_msg}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.8,
-                max_tokens=4000,
-                timeout=90
-            )
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_msg}
+            ]
+            if on_slide and SCRIPT_STREAMING:
+                with metrics.provider_call('openai', 'script_stream'):
+                    raw_content = _stream_completion(messages, on_slide)
+            else:
+                with metrics.provider_call('openai', 'script'):
+                    response = openai_client.chat.completions.create(
+                        model=GPT_MODEL,
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                        temperature=0.8,
+                        max_tokens=4000,
+                        timeout=90
+                    )
+                raw_content = response.choices[0].message.content
 
             print("2. Parsing output...")
-            raw_content = response.choices[0].message.content
             if not raw_content:
                 print(f"Empty content from model on attempt {attempt}, retrying...")
                 if attempt == 3:
@@ -143,38 +297,7 @@ Return JSON matching this schema exactly:
         slides = script_json.get('slides', [])
 
         for i, slide in enumerate(slides):
-            # coerce required string fields
-            narration = _to_str(slide.get('narration_prompt', ''))
-            if not narration:
-                raise ValueError(f"Slide {i+1} missing narration_prompt")
-            slide['narration_prompt'] = narration
-
-            image_prompt = _to_str(slide.get('image_prompt', ''))
-            if not image_prompt:
-                raise ValueError(f"Slide {i+1} missing image_prompt")
-            slide['image_prompt'] = image_prompt
-
-            # coerce duration to int
-            try:
-                slide['duration'] = int(float(slide.get('duration') or 8))
-            except (TypeError, ValueError):
-                slide['duration'] = 8
-
-            # validate voice_id
-            if not slide.get('voice_id') or slide['voice_id'] not in AVAILABLE_VOICES:
-                slide['voice_id'] = 'Matthew'
-
-            # validate context_refs — integers only, back-references only
-            raw_refs = slide.get('context_refs', [])
-            coerced = []
-            for r in raw_refs:
-                try:
-                    idx = int(r)
-                    if 0 <= idx < i:
-                        coerced.append(idx)
-                except (TypeError, ValueError):
-                    pass
-            slide['context_refs'] = coerced
+            _normalize_slide(slide, i)
 
         # validate content_type
         if script_json.get('content_type') not in VALID_CONTENT_TYPES:
@@ -223,14 +346,15 @@ Return JSON with these four string fields:
 }}"""
 
     try:
-        response = openai_client.chat.completions.create(
-            model=GPT_MODEL,
-            messages=[{"role": "user", "content": bible_prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.7,
-            max_tokens=400,
-            timeout=30
-        )
+        with metrics.provider_call('openai', 'visual_bible'):
+            response = openai_client.chat.completions.create(
+                model=GPT_MODEL,
+                messages=[{"role": "user", "content": bible_prompt}],
+                response_format={"type": "json_object"},
+                temperature=0.7,
+                max_tokens=400,
+                timeout=30
+            )
 
         raw = response.choices[0].message.content
         if not raw:
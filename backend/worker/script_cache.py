@@ -0,0 +1,62 @@
+# Opt-in shared cache of Director output (SCRIPT_CACHE=1). The validated, normalised script and
+# its visual bible are stored together in Redis, so a repeat of the same normalised prompt skips
+# the whole Director stage (the script call, its retries and the visual bible call).
+#   entry: keyframe:script_cache:<sha256>  (JSON, expires after SCRIPT_CACHE_TTL)
+#   index: keyframe:script_cache:lru       (zset of keys by last use, trimmed to SCRIPT_CACHE_MAX_ENTRIES)
+# The key covers the prompt, style, model and script.PROMPT_TEMPLATE_VERSION.
+import os
+import re
+import json
+import time
+import redis_client
+from disk_cache import hash_key
+
+SCRIPT_CACHE = os.getenv('SCRIPT_CACHE', '0') == '1'
+SCRIPT_CACHE_TTL = int(os.getenv('SCRIPT_CACHE_TTL', '86400'))
+SCRIPT_CACHE_MAX_ENTRIES = int(os.getenv('SCRIPT_CACHE_MAX_ENTRIES', '1000'))
+
+PREFIX = 'keyframe:script_cache'
+LRU_KEY = f'{PREFIX}:lru'
+
+def normalize_prompt(prompt):
+    """Case, whitespace and trailing punctuation don't change the script we'd ask for"""
+    text = re.sub(r'\s+', ' ', (prompt or '').strip().lower())
+    return text.rstrip(' .!?')
+
+def cache_key(prompt, style, model, template_version):
+    return f'{PREFIX}:' + hash_key(normalize_prompt(prompt), (style or 'Default').strip().lower(), model, template_version)
+
+def lookup(key):
+    """Cached script_data (with 'visual_bible'), or None; never raises"""
+    if not SCRIPT_CACHE:
+        return None
+    try:
+        client = redis_client.get_client()
+        raw = client.get(key)
+        if raw is None:
+            return None
+        client.zadd(LRU_KEY, {key: time.time()})
+        return json.loads(raw)
+    except Exception as e:
+        print(f"Script cache: lookup failed ({e})")
+        return None
+
+def store(key, script_data):
+    """Store the Director output and trim the cache to SCRIPT_CACHE_MAX_ENTRIES; never raises"""
+    if not SCRIPT_CACHE:
+        return
+    try:
+        client = redis_client.get_client()
+        pipe = client.pipeline()
+        pipe.set(key, json.dumps(script_data), ex=SCRIPT_CACHE_TTL)
+        pipe.zadd(LRU_KEY, {key: time.time()})
+        # entries whose TTL lapsed are dropped from the index too
+        pipe.zremrangebyscore(LRU_KEY, '-inf', time.time() - SCRIPT_CACHE_TTL)
+        pipe.zcard(LRU_KEY)
+        size = pipe.execute()[-1]
+        if size > SCRIPT_CACHE_MAX_ENTRIES:
+            evicted = [k for k, _ in client.zpopmin(LRU_KEY, size - SCRIPT_CACHE_MAX_ENTRIES)]
+            if evicted:
+                client.delete(*evicted)
+    except Exception as e:
+        print(f"Script cache: store failed ({e})")
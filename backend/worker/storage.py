@@ -1,85 +1,126 @@
 #This is where everything will be stored (the storage will follow a stack kind of approach. 
 #Each topic will have 5 videos. When a new one is generated, the old one will disappear. 
 import os
-import boto3
+import time
+import clients
+import metrics
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import BotoCoreError, ClientError
+from concurrent.futures import ThreadPoolExecutor
 import subprocess
 
+MB = 1024 * 1024
+# same bound as assemble.FFMPEG_TIMEOUT: a hung FFmpeg must not hold the job's execution slot
+FFMPEG_TIMEOUT = float(os.getenv('FFMPEG_TIMEOUT', '180'))
+
+# multipart settings for the MP4; max_concurrency should stay within AWS_MAX_POOL_CONNECTIONS
+VIDEO_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=int(float(os.getenv('R2_MULTIPART_THRESHOLD_MB', '8')) * MB),
+    multipart_chunksize=int(float(os.getenv('R2_MULTIPART_CHUNK_MB', '8')) * MB),
+    max_concurrency=int(os.getenv('R2_MAX_CONCURRENCY', '8')),
+    use_threads=True,
+)
+
+def _upload(s3_client, path, bucket_name, key, content_type, config=None):
+    """Upload one public object; returns elapsed seconds"""
+    start = time.perf_counter()
+    kwargs = {'Config': config} if config else {}
+    with open(path, 'rb') as f, metrics.provider_call('r2', 'upload'):
+        s3_client.upload_fileobj(
+            f,
+            bucket_name,
+            key,
+            ExtraArgs={
+                'ContentType': content_type,
+                'ACL': 'public-read'  # makes it publicly accessible
+            },
+            **kwargs
+        )
+    return time.perf_counter() - start
+
 # MODIFIED: Added temp_dir parameter
-def upload_files(job_id, video_path, temp_dir):
+def upload_files(job_id, video_path, temp_dir, log=None, image_paths=None):
     """Upload video and thumbnail to Cloudflare R2
-    Returns (video_url, thumbnail_url)
+    The thumbnail is built and uploaded while the video's multipart upload runs. When the
+    source slides are given, the thumbnail, an animated preview (previews/<id>.webp) and a
+    scrub sprite (sprites/<id>.jpg) are built from them instead of decoding the final MP4.
+    Returns (video_url, thumbnail_url, derivative_urls) where derivative_urls has
+    preview_url and sprite_url (both None when the derivatives could not be built)
     """
     
-    # gets the cloudflare r2 credentials from environment
-    account_id = os.getenv('CLOUDFLARE_ACCOUNT_ID')
-    access_key_id = os.getenv('CLOUDFLARE_ACCESS_KEY_ID')
-    secret_access_key = os.getenv('CLOUDFLARE_SECRET_ACCESS_KEY')
     bucket_name = os.getenv('R2_BUCKET_NAME')
-    
-    # construct the r2 endpoint url
-    # format: https://<account_id>.r2.cloudflarestorage.com
-    endpoint_url = f'https://{account_id}.r2.cloudflarestorage.com'
-    
-    # initializes s3 client for cloudflare r2
-    # verify=False works around SSL handshake failures on Python 3.14
-    s3_client = boto3.client(
-        's3',
-        endpoint_url=endpoint_url,
-        aws_access_key_id=access_key_id,
-        aws_secret_access_key=secret_access_key,
-        region_name='auto'
-    )
+
+    # shared, long-lived s3 client for cloudflare r2 (see clients.py)
+    s3_client = clients.get_r2()
     try:
         print(f"Uploading video to Cloudflare R2...")
         
         # generates unique filenames using job_id
         video_filename = f'videos/{job_id}.mp4'
         thumbnail_filename = f'thumbnails/{job_id}.jpg'
-        
-        # uploads the video file
-        with open(video_path, 'rb') as video_file:
-            s3_client.upload_fileobj(
-                video_file,
-                bucket_name,
-                video_filename,
-                ExtraArgs={
-                    'ContentType':'video/mp4',
-                    'ACL': 'public-read'  # makes it publicly accessible
-                }
-            )
-        
-        print(f"Video uploaded successfully: {video_filename}")
-        
-        # generates thumbnail from the video
-        # MODIFIED: Pass temp_dir to generate_thumbnail
-        thumbnail_path = generate_thumbnail(video_path, temp_dir, job_id) 
-        # uploads the thumbnail
-        with open(thumbnail_path, 'rb') as thumbnail_file:
-            s3_client.upload_fileobj(
-                thumbnail_file,
-                bucket_name,
-                thumbnail_filename,
-                ExtraArgs={
-                    'ContentType': 'image/jpeg',
-                    'ACL': 'public-read'
-                }
+
+        public_domain = os.getenv('R2_PUBLIC_DOMAIN', f'{bucket_name}.r2.dev')
+
+        def thumbnail_task():
+            start = time.perf_counter()
+            derivatives = None
+            if image_paths:
+                try:
+                    derivatives = generate_derivatives(image_paths, temp_dir, job_id)
+                except Exception as e:
+                    print(f"{e} — falling back to a thumbnail from the final video")
+            if derivatives:
+                thumbnail_path = derivatives['thumbnail']
+            else:
+                # MODIFIED: Pass temp_dir to generate_thumbnail
+                thumbnail_path = generate_thumbnail(video_path, temp_dir, job_id)
+            extract = time.perf_counter() - start
+
+            upload = _upload(s3_client, thumbnail_path, bucket_name, thumbnail_filename, 'image/jpeg')
+            print(f"Thumbnail uploaded successfully: {thumbnail_filename}")
+            metrics.bytes_produced('thumbnail', thumbnail_path)
+            urls = {'preview_url': None, 'sprite_url': None}
+            if derivatives:
+                for kind, path, key, content_type in (
+                    ('preview', derivatives['preview'], f'previews/{job_id}.webp', 'image/webp'),
+                    ('sprite', derivatives['sprite'], f'sprites/{job_id}.jpg', 'image/jpeg'),
+                ):
+                    upload += _upload(s3_client, path, bucket_name, key, content_type)
+                    metrics.bytes_produced(kind, path)
+                    urls[f'{kind}_url'] = f'https://{public_domain}/{key}'
+                    print(f"Derivative uploaded: {urls[f'{kind}_url']}")
+            return extract, upload, urls
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future_video = executor.submit(
+                _upload, s3_client, video_path, bucket_name, video_filename, 'video/mp4', VIDEO_TRANSFER_CONFIG
             )
-        
-        print(f"Thumbnail uploaded successfully: {thumbnail_filename}")
+            future_thumbnail = executor.submit(thumbnail_task)
+            video_seconds = future_video.result()
+            print(f"Video uploaded successfully: {video_filename}")
+            metrics.bytes_produced('video', video_path)
+            extract_seconds, thumbnail_seconds, derivative_urls = future_thumbnail.result()
+        total = time.perf_counter() - start
+
+        size_mb = os.path.getsize(video_path) / MB
+        report = (f"upload finished in {total:.2f}s — video {size_mb:.1f} MB in {video_seconds:.2f}s "
+                  f"({size_mb / max(video_seconds, 1e-6):.1f} MB/s, {VIDEO_TRANSFER_CONFIG.multipart_chunksize // MB} MB parts "
+                  f"x {VIDEO_TRANSFER_CONFIG.max_concurrency}), thumbnail/derivatives build {extract_seconds:.2f}s + upload {thumbnail_seconds:.2f}s in parallel")
+        print(report)
+        if log:
+            log(f'Storage: {report}')
         
         # constructs the public urls
         # format: https://pub-xxxxx.r2.dev/filename
         # note: need to set up a public R2 domain in cloudflare dashboard
-        public_domain = os.getenv('R2_PUBLIC_DOMAIN', f'{bucket_name}.r2.dev')
-        
         video_url = f'https://{public_domain}/{video_filename}'
         thumbnail_url = f'https://{public_domain}/{thumbnail_filename}'
         
         print(f"Video URL: {video_url}")
         print(f"Thumbnail URL: {thumbnail_url}")
         
-        return video_url, thumbnail_url
+        return video_url, thumbnail_url, derivative_urls
         
     except (BotoCoreError, ClientError) as error:
         print(f"Error uploading to R2: {error}")
@@ -113,13 +154,15 @@ def generate_thumbnail(video_path, temp_dir, job_id):
             thumbnail_path
         ]
         
-        result = subprocess.run(
-            ffmpeg_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True
-        )
+        with metrics.ffmpeg('thumbnail'):
+            result = subprocess.run(
+                ffmpeg_command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                check=True,
+                timeout=FFMPEG_TIMEOUT
+            )
         
         print(f"Thumbnail generated: {thumbnail_path}")
         return thumbnail_path
@@ -131,5 +174,53 @@ def generate_thumbnail(video_path, temp_dir, job_id):
         print(f"Unexpected error generating thumbnail: {e}")
         raise
 
+def build_derivatives_cmd(image_paths, thumbnail_path, preview_path, sprite_path):
+    """One FFmpeg call over the source slide JPEGs (no decode of the final H.264):
+    - thumbnail: slide 1 at 1280x720 (the frame the old 1s seek landed on)
+    - preview:   animated WebP, one slide per frame at PREVIEW_FPS, 320x180
+    - sprite:    scrub sheet, all slides side by side at 160x90
+    """
+    FFMPEG_PATH = os.getenv('FFMPEG_PATH') or os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'bin', 'ffmpeg.exe'))
+    n = len(image_paths)
+    preview_fps = os.getenv('PREVIEW_FPS', '2')
+
+    cmd = [FFMPEG_PATH, '-y']
+    for image_path in image_paths:
+        cmd += ['-i', image_path]
+
+    small = 'scale=320:180:force_original_aspect_ratio=decrease,pad=320:180:(ow-iw)/2:(oh-ih)/2,setsar=1'
+    chains = ['[0:v]split=2[t][f0]', '[t]scale=1280:720[thumb]']
+    for i in range(n):
+        source = f'[f{i}]' if i == 0 else f'[{i}:v]'
+        chains.append(f'{source}{small},split=2[p{i}][x{i}]')
+        chains.append(f'[x{i}]scale=160:90[s{i}]')
+    chains.append(''.join(f'[p{i}]' for i in range(n)) + f'concat=n={n}:v=1:a=0,setpts=N/{preview_fps}/TB[preview]')
+    chains.append(''.join(f'[s{i}]' for i in range(n)) + f'concat=n={n}:v=1:a=0,tile={n}x1[sprite]')
+
+    cmd += [
+        '-filter_complex', ';'.join(chains),
+        '-map', '[thumb]', '-frames:v', '1', '-q:v', '2', thumbnail_path,
+        '-map', '[preview]', '-c:v', 'libwebp', '-loop', '0', '-quality', '60', preview_path,
+        '-map', '[sprite]', '-frames:v', '1', '-q:v', '4', sprite_path,
+    ]
+    return cmd
+
+def generate_derivatives(image_paths, temp_dir, job_id):
+    """Build thumbnail, animated preview and sprite sheet from the source slides in one pass
+    Returns {'thumbnail': path, 'preview': path, 'sprite': path}
+    """
+    paths = {
+        'thumbnail': os.path.join(temp_dir, f'thumbnail{job_id}.jpg'),
+        'preview': os.path.join(temp_dir, f'preview{job_id}.webp'),
+        'sprite': os.path.join(temp_dir, f'sprite{job_id}.jpg'),
+    }
+    cmd = build_derivatives_cmd(image_paths, paths['thumbnail'], paths['preview'], paths['sprite'])
+    with metrics.ffmpeg('derivatives'):
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=FFMPEG_TIMEOUT)
+    if result.returncode != 0:
+        raise Exception(f"Failed to generate derivatives: {result.stderr[-500:]}")
+    print(f"Derivatives generated from {len(image_paths)} slides: {', '.join(paths.values())}")
+    return paths
+
 # REMOVED: The entire delete_temp_files function is deleted 
 # as cleanup is now centralized in orchestrator.py.
\ No newline at end of file
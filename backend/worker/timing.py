@@ -0,0 +1,47 @@
+import time
+import threading
+from contextlib import contextmanager
+import metrics
+
+
+class JobClock:
+    """Wall-clock offsets for a single job, used for per-stage and per-slide timing logs"""
+
+    def __init__(self, started_at=None, stages=None):
+        # wall-clock start, so a job's stages can be timed across tasks and worker processes
+        self.started_at = started_at or time.time()
+        self.stages = {name: tuple(span) for name, span in (stages or {}).items()}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        return cls(data.get('started_at'), data.get('stages'))
+
+    def to_dict(self):
+        with self._lock:
+            return {'started_at': self.started_at, 'stages': {name: list(span) for name, span in self.stages.items()}}
+
+    def now(self):
+        """Seconds since the job started"""
+        return time.time() - self.started_at
+
+    @contextmanager
+    def stage(self, name):
+        start = self.now()
+        try:
+            yield
+        finally:
+            end = self.now()
+            with self._lock:
+                self.stages[name] = (start, end)
+            metrics.observe_stage(name, end - start)
+
+    def summary(self):
+        """One line like 'director 0.0-7.2s (7.2s) | assets 7.2-31.0s (23.8s)'"""
+        with self._lock:
+            parts = [
+                f"{name} {start:.1f}-{end:.1f}s ({end - start:.1f}s)"
+                for name, (start, end) in sorted(self.stages.items(), key=lambda kv: kv[1][0])
+            ]
+        return ' | '.join(parts)
@@ -1,12 +1,144 @@
 import os
 import tempfile
-import boto3
-from botocore.config import Config
+import shutil
+import socket
 from botocore.exceptions import BotoCoreError, ClientError
 import subprocess
 import random
+import threading
+import time
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from disk_cache import DiskCache, RedisIndex, hash_key
+import redis_client
+import clients
+import mp3_index
+import metrics
+
+ENGINE_CHAIN = ('generative', 'neural', 'standard')
+OUTPUT_FORMAT = 'mp3'
+
+# synthesized slide audio keyed on (narration, voice, engine, format), with the measured
+# duration stored alongside so cache hits skip both Polly and get_audio_duration. The Redis
+# index holds local paths, so it is keyed per host: another host's workers must neither see
+# those entries nor forget them when the path isn't on their disk
+tts_cache = DiskCache(
+    'tts',
+    os.getenv('TTS_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'keyframe_tts_cache'),
+    int(float(os.getenv('TTS_CACHE_MAX_MB', '512')) * 1024 * 1024),
+    index=RedisIndex(f'keyframe:tts_cache:{socket.gethostname()}', redis_client.get_client) if os.getenv('TTS_CACHE_REDIS') == '1' else None,
+)
+
+def tts_cache_key(narration, voice_id, engine, output_format=OUTPUT_FORMAT):
+    return hash_key(narration, voice_id, engine, output_format)
+
+def _cached_voiceover(narration, voice_id, dest_path):
+    """Copy a cached synthesis to dest_path; returns its duration, or None on a miss"""
+    if not tts_cache.enabled:
+        return None
+    for engine in ENGINE_CHAIN:
+        key = tts_cache_key(narration, voice_id, engine)
+        meta = tts_cache.get_meta(key)
+        if not meta or not meta.get('duration'):
+            continue
+        if tts_cache.fetch(key, '.mp3', dest_path):
+            return float(meta['duration'])
+    return None
+
+# (voice_id, engine) capability table: seeded from describe_voices and refined by learned
+# failures, so voices without generative support go straight to the engine that works
+CAPABILITY_TTL = int(os.getenv('POLLY_CAPABILITY_TTL', '3600'))
+
+_voice_engines = {}        # voice_id -> set of supported engines (from describe_voices)
+_voice_engines_loaded_at = 0.0
+_learned_unsupported = {}  # (voice_id, engine) -> expiry timestamp
+_capability_lock = threading.Lock()
+
+def _is_unsupported_engine(error):
+    """Polly's answer for an engine the voice lacks; ValidationException also covers bad input
+    (text too long, bad parameters), so it only counts when the message is about the engine"""
+    info = error.response.get('Error', {})
+    if info.get('Code') == 'EngineNotSupportedException':
+        return True
+    return info.get('Code') == 'ValidationException' and 'engine' in info.get('Message', '').lower()
+
+def _fetch_voice_engines(polly):
+    table = {}
+    kwargs = {}
+    while True:
+        response = polly.describe_voices(**kwargs)
+        for voice in response.get('Voices', []):
+            table[voice['Id']] = set(voice.get('SupportedEngines', []))
+        if not response.get('NextToken'):
+            break
+        kwargs = {'NextToken': response['NextToken']}
+    return table
+
+def _refresh_voice_engines(polly, now):
+    global _voice_engines, _voice_engines_loaded_at
+    try:
+        table = _fetch_voice_engines(polly)
+    except Exception as e:
+        # keep whatever we had; learned failures still apply
+        print(f"Polly describe_voices failed ({e}), using learned capabilities only")
+        with _capability_lock:
+            _voice_engines_loaded_at = now - CAPABILITY_TTL + 60  # try again in a minute
+        return
+    with _capability_lock:
+        _voice_engines = table
+    print(f"Polly capabilities loaded for {len(table)} voices")
+
+def engines_for(polly, voice_id):
+    """ENGINE_CHAIN filtered down to the engines this voice is known to support"""
+    global _voice_engines_loaded_at
+    now = time.time()
+    with _capability_lock:
+        # one thread claims the refresh; the network call happens outside the lock and
+        # every other thread keeps using the current table meanwhile
+        refresh = now - _voice_engines_loaded_at > CAPABILITY_TTL
+        if refresh:
+            _voice_engines_loaded_at = now
+    if refresh:
+        _refresh_voice_engines(polly, now)
+    with _capability_lock:
+        supported = _voice_engines.get(voice_id)
+        engines = [
+            engine for engine in ENGINE_CHAIN
+            if (supported is None or engine in supported)
+            and _learned_unsupported.get((voice_id, engine), 0) < now
+        ]
+    return engines or list(ENGINE_CHAIN)
+
+def _mark_unsupported(voice_id, engine):
+    with _capability_lock:
+        _learned_unsupported[(voice_id, engine)] = time.time() + CAPABILITY_TTL
+    print(f"Polly: learned that {voice_id} does not support the {engine} engine")
+
+def _synthesize(polly, narration, voice_id):
+    """Call Polly with the first engine that works for this voice; returns (response, engine)"""
+    last_error = None
+    for engine in engines_for(polly, voice_id):
+        try:
+            # plain text only (generative does not support SSML)
+            with metrics.provider_call('polly', engine):
+                response = polly.synthesize_speech(
+                    Text=narration,
+                    TextType='text',
+                    OutputFormat=OUTPUT_FORMAT,
+                    VoiceId=voice_id,
+                    Engine=engine
+                )
+            return response, engine
+        except ClientError as e:
+            last_error = e
+            if _is_unsupported_engine(e):
+                _mark_unsupported(voice_id, engine)
+            else:
+                print(f"Polly {engine} failed for {voice_id} ({e}), trying next engine")
+        except Exception as e:
+            last_error = e
+            print(f"Polly {engine} failed for {voice_id} ({e}), trying next engine")
+    raise last_error
 
 # main audio duration extraction
 def get_audio_duration_mutagen(path):
@@ -25,12 +157,23 @@ def get_audio_duration_ffprobe(path):
             FFPROBE_PATH, '-v', 'error', '-select_streams', 'a:0', '-show_entries',
             'stream=duration', '-of', 'default=noprint_wrappers=1:nokey=1', path
         ]
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True, timeout=30)
         return float(result.stdout.strip())
     except Exception:
         return None
 
+# exact duration from a single frame-header walk; no library or subprocess on the hot path
+def get_audio_duration_index(path):
+    try:
+        return mp3_index.index_file(path).duration
+    except (OSError, ValueError):
+        return None
+
 def get_audio_duration(path):
+    result = get_audio_duration_index(path)
+    if result:
+        return result
+
     result = get_audio_duration_mutagen(path)
 
     if result:
@@ -43,87 +186,139 @@ def get_audio_duration(path):
     print("Error recieving audio duration.")
     return None
 
+def slide_audio_path(temp_dir, i):
+    return os.path.join(temp_dir, f'slide_{i}.mp3')
+
+def _discard_cached_voiceover(narration, voice_id):
+    """Drop cached syntheses for a slide the auditor rejected, so the retry reaches Polly"""
+    for engine in ENGINE_CHAIN:
+        tts_cache.discard(tts_cache_key(narration, voice_id, engine), '.mp3')
+
+def synthesize_slide(i, slide, dest_path, use_cache=True):
+    """Synthesize (or fetch from the TTS cache) one slide's narration into dest_path.
+    Returns (dest_path, duration, Mp3Index or None)."""
+    return _synthesize_slide(i, slide, dest_path, use_cache)[:3]
+
+def _synthesize_slide(i, slide, dest_path, use_cache=True):
+    """synthesize_slide that also reports whether the TTS cache served it: (..., hit)"""
+    narration = slide.get('narration_prompt', '')
+    voice_id = slide.get('voice_id', 'Matthew')
+
+    cached_duration = _cached_voiceover(narration, voice_id, dest_path) if use_cache else None
+    if cached_duration is not None:
+        # re-measure from the frame index so durations match the stripped concat exactly
+        index = None
+        try:
+            index = mp3_index.index_file(dest_path)
+            cached_duration = index.duration
+        except ValueError:
+            pass
+        print(f"{i+1}. TTS cache hit for slide {i+1} ({voice_id}, {cached_duration:.2f}s)")
+        return dest_path, cached_duration, index, True
+
+    print(f"{i+1}. Polly: narrating slide {i+1} with {voice_id} ({len(narration)} chars)")
+
+    # generative -> neural -> standard, skipping engines the voice is known not to support
+    response, engine = _synthesize(clients.get_polly(), narration, voice_id)
+
+    audio_stream = response.get('AudioStream')
+    if not audio_stream:
+        raise Exception(f'No audio stream returned for slide {i}')
+
+    audio_bytes = audio_stream.read()
+    with open(dest_path, 'wb') as f:
+        f.write(audio_bytes)
+
+    # measure duration from the frame index (kept for the concat), falling back to mutagen/ffprobe
+    index = None
+    try:
+        index = mp3_index.index_bytes(audio_bytes)
+        duration = index.duration
+    except ValueError as e:
+        print(f"Slide {i+1}: frame index failed ({e}), measuring with mutagen/ffprobe")
+        duration = get_audio_duration(dest_path)
+    if duration is None:
+        raise Exception(f"Could not determine duration for {dest_path}")
+
+    tts_cache.put(tts_cache_key(narration, voice_id, engine), '.mp3', dest_path, meta={'duration': float(duration), 'engine': engine})
+
+    print(f"Slide {i+1} duration: {duration:.2f}s")
+    return dest_path, float(duration), index, False
+
+def _take_prefetched(prefetched, i, slide, dest_path):
+    """Result of a slide synthesized while the script was still streaming, copied to dest_path,
+    or None if there is none or the final script changed that slide's narration or voice.
+    Copied, not moved: the source is a checkpointed output of the director stage, and a
+    resumed assets stage needs to find it again"""
+    entry = prefetched.get(i)
+    if not entry:
+        return None
+    narration, voice_id, future = entry
+    if narration != slide.get('narration_prompt', '') or voice_id != slide.get('voice_id', 'Matthew'):
+        return None
+    try:
+        path, duration, index = future.result()
+        shutil.copyfile(path, dest_path)
+    except Exception as e:
+        print(f"Slide {i+1}: early synthesis unusable ({e}), synthesizing again")
+        return None
+    print(f"{i+1}. Using slide {i+1} audio synthesized while the script streamed ({duration:.2f}s)")
+    return dest_path, duration, index
+
 # main tts generation method — voice is now per-slide from script_json
-def generate_voice_over(script_json, job_id, temp_dir, style=None):
+def generate_voice_over(script_json, job_id, temp_dir, style=None, on_slide=None, indices=None, durations=None, prefetched=None):
+    """Synthesize every slide and concatenate; returns (full_audio_path, slide_durations, tts)
+    where tts counts this call's slides by source: {'cache_hits', 'synthesized', 'prefetched'}.
+    With indices (auditor retries) only those slides are re-synthesized, bypassing the TTS
+    cache; the other slides keep their audio on disk and their entry in durations.
+    prefetched maps slide index -> (narration, voice_id, future of synthesize_slide) for
+    slides already synthesized from the streaming Director."""
     print("Beginning voice over generation...\n\n")
 
-    polly = boto3.client(
-        'polly',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-        region_name=os.getenv('AWS_REGION', 'us-east-1'),
-        config=Config(connect_timeout=10, read_timeout=30)
-    )
-
     slides = script_json.get('slides', [])
 
     print("1. Voice assignments per slide:")
     for i, slide in enumerate(slides):
         print(f"   Slide {i+1}: {slide.get('voice_id', 'Matthew')}")
 
-    print("\n2. Generating all voiceovers in parallel (polly api calls)... \n")
+    todo = list(range(len(slides))) if indices is None else sorted(set(indices))
+    print(f"\n2. Generating {len(todo)}/{len(slides)} voiceovers in parallel (polly api calls)... \n")
     os.makedirs(temp_dir, exist_ok=True)
 
     try:
         def generate_single_voiceover(i, slide):
-            narration = slide.get('narration_prompt', '')
-            voice_id = slide.get('voice_id', 'Matthew')
-
-            print(f"{i+1}. Polly: narrating slide {i+1}/{len(slides)} with {voice_id} ({len(narration)} chars)")
-
-            # generative engine: plain text only (generative does not support SSML)
-            try:
-                response = polly.synthesize_speech(
-                    Text=narration,
-                    TextType='text',
-                    OutputFormat='mp3',
-                    VoiceId=voice_id,
-                    Engine='generative'
-                )
-            except Exception:
-                # voice not supported on generative — fall back to neural plain text
-                try:
-                    response = polly.synthesize_speech(
-                        Text=narration,
-                        TextType='text',
-                        OutputFormat='mp3',
-                        VoiceId=voice_id,
-                        Engine='neural'
-                    )
-                except Exception:
-                    # final fallback: standard engine
-                    response = polly.synthesize_speech(
-                        Text=narration,
-                        TextType='text',
-                        OutputFormat='mp3',
-                        VoiceId=voice_id,
-                        Engine='standard'
-                    )
-
-            audio_stream = response.get('AudioStream')
-            if not audio_stream:
-                raise Exception(f'No audio stream returned for slide {i}')
-
-            slide_mp3 = os.path.join(temp_dir, f'slide_{i}.mp3')
-            with open(slide_mp3, 'wb') as f:
-                f.write(audio_stream.read())
-
-            # measure duration
-            duration = get_audio_duration(slide_mp3)
-            if duration is None:
-                raise Exception(f"Could not determine duration for {slide_mp3}")
-
-            print(f"Slide {i+1} duration: {duration:.2f}s")
-            return (i, slide_mp3, float(duration))
+            slide_mp3 = slide_audio_path(temp_dir, i)
+            result = _take_prefetched(prefetched, i, slide, slide_mp3) if prefetched else None
+            if result is not None:
+                source = 'prefetched'
+            else:
+                if indices is not None:
+                    _discard_cached_voiceover(slide.get('narration_prompt', ''), slide.get('voice_id', 'Matthew'))
+                *result, hit = _synthesize_slide(i, slide, slide_mp3, use_cache=indices is None)
+                source = 'cache_hits' if hit else 'synthesized'
+            _, duration, index = result
+            if index is not None:
+                indexes[i] = index
+            if on_slide:
+                on_slide(i, slide_mp3, duration)
+            return (i, slide_mp3, duration, source)
 
         # Execute voiceover generation in parallel
+        indexes = {}  # i -> Mp3Index from synthesis, so the concat doesn't re-scan
         voiceover_results = {}
-        with ThreadPoolExecutor(max_workers=len(slides)) as executor:
-            futures = {executor.submit(generate_single_voiceover, i, slide): i for i, slide in enumerate(slides)}
+        if indices is not None:
+            for i in range(len(slides)):
+                if i not in todo:
+                    voiceover_results[i] = (slide_audio_path(temp_dir, i), float(durations[i]))
+        with ThreadPoolExecutor(max_workers=max(1, len(todo))) as executor:
+            futures = {executor.submit(generate_single_voiceover, i, slides[i]): i for i in todo}
 
+            # counted per call: tts_cache's own counters are process-wide, across jobs
+            tts = {'cache_hits': 0, 'synthesized': 0, 'prefetched': 0}
             for future in as_completed(futures):
-                i, slide_mp3, duration = future.result()
+                i, slide_mp3, duration, source = future.result()
                 voiceover_results[i] = (slide_mp3, duration)
+                tts[source] += 1
 
         # Sort by index to maintain order
         slide_paths = []
@@ -133,16 +328,29 @@ def generate_voice_over(script_json, job_id, temp_dir, style=None):
             slide_paths.append(path)
             slide_durations.append(duration)
 
-        # concatenate slide mp3s into one file using pure Python binary concat
+        # concatenate slide mp3s into one file: audio frames only, so the per-file ID3 tags and
+        # Xing/Info frames don't end up mid-stream (players and the AAC mux read them as audio)
         print("\n3. Concatenating slide mp3s into one...")
 
         full_audio = os.path.join(temp_dir, 'voiceover_full.mp3')
 
-        print("Concatenating slide audio into full voiceover...")
+        print("Concatenating slide audio frames into full voiceover...")
+        stripped = 0
         with open(full_audio, 'wb') as outfile:
-            for p in slide_paths:
-                with open(p, 'rb') as infile:
-                    outfile.write(infile.read())
+            for i, p in enumerate(slide_paths):
+                index = indexes.get(i)
+                if index is None:
+                    try:
+                        index = mp3_index.index_file(p)
+                    except ValueError as e:
+                        print(f"Slide {i+1}: frame index failed ({e}), copying file as-is")
+                        with open(p, 'rb') as infile:
+                            outfile.write(infile.read())
+                        continue
+                mp3_index.write_audio_frames(p, index, outfile)
+                stripped += index.metadata_bytes
+        if stripped:
+            print(f"Stripped {stripped} bytes of per-file tags/header frames from the concat")
 
         # final sanity check
         print("4. Final tts checks...")
@@ -152,8 +360,9 @@ def generate_voice_over(script_json, job_id, temp_dir, style=None):
 
         total = sum(slide_durations)
         print(f"Voiceover created: {full_audio} (total {total:.2f}s)")
+        print(f"TTS: {tts['cache_hits']} cache hits, {tts['synthesized']} synthesized, {tts['prefetched']} prefetched")
 
-        return full_audio, slide_durations
+        return full_audio, slide_durations, tts
 
     except (BotoCoreError, ClientError) as e:
         print(f"Polly error: {e}")
@@ -1,15 +1,133 @@
 import os
-import boto3
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import clients
+import redis_client
 from openai import OpenAI
 
+# Preflight results are cached per worker (and optionally in Redis) and refreshed by a
+# background heartbeat, so a job only pays for the provider round trips when the cached
+# status is stale or unhealthy. The heartbeat only refreshes while jobs are coming in (a
+# preflight within WATCHMAN_IDLE seconds), and with WATCHMAN_REDIS=1 one worker refreshes
+# the shared status for all of them.
+WATCHMAN_TTL = int(os.getenv('WATCHMAN_TTL', '60'))
+WATCHMAN_HEARTBEAT = int(os.getenv('WATCHMAN_HEARTBEAT', str(max(5, WATCHMAN_TTL // 2))))
+WATCHMAN_IDLE = int(os.getenv('WATCHMAN_IDLE', '600'))
+WATCHMAN_REDIS = os.getenv('WATCHMAN_REDIS') == '1'
+REDIS_KEY = 'keyframe:watchman:status'
+REFRESH_LOCK_KEY = 'keyframe:watchman:refreshing'
+
+_status = None  # {'ok': bool, 'error': str|None, 'checked_at': epoch seconds}
+_status_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_heartbeat = None
+_last_preflight = 0.0
+
 def preflight(job_id):
+    global _last_preflight
     print(f"Watchman: starting pre-flight checks for job {job_id}...")
-    _check_ffmpeg()
-    _ping_openai()
-    _ping_replicate()
-    _ping_aws()
+    _last_preflight = time.time()
+    start_heartbeat()
+    status = _cached_status()
+    if status and status['ok']:
+        print(f"Watchman: cached status OK ({time.time() - status['checked_at']:.0f}s old), skipping checks.\n")
+        return
+    status = refresh()
+    if not status['ok']:
+        raise Exception(status['error'])
     print("Watchman: all pre-flight checks passed.\n")
 
+def refresh(force=False):
+    """Run every check concurrently and publish the result to the local (and Redis) cache"""
+    with _refresh_lock:
+        status = None if force else _cached_status()
+        if status and status['ok']:
+            # another thread refreshed while we waited
+            return status
+        checks = [_check_ffmpeg, _ping_openai, _ping_replicate, _ping_aws]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+            futures = [executor.submit(check) for check in checks]
+            errors = []
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(str(e))
+        status = {'ok': not errors, 'error': '; '.join(errors) or None, 'checked_at': time.time()}
+        print(f"Watchman: checks finished in {time.perf_counter() - start:.2f}s ({'OK' if status['ok'] else 'UNHEALTHY'})")
+        _store_status(status)
+        return status
+
+def _cached_status(max_age=WATCHMAN_TTL):
+    """Most recent status younger than max_age from this worker or, if enabled, from Redis"""
+    global _status
+    with _status_lock:
+        status = _status
+    if status and time.time() - status['checked_at'] < max_age:
+        return status
+    if WATCHMAN_REDIS:
+        try:
+            raw = redis_client.get_client().get(REDIS_KEY)
+            if raw:
+                shared = json.loads(raw)
+                if time.time() - shared['checked_at'] < max_age:
+                    with _status_lock:
+                        _status = shared
+                    return shared
+        except Exception as e:
+            print(f"Watchman: could not read shared status ({e})")
+    return None
+
+def _store_status(status):
+    global _status
+    with _status_lock:
+        _status = status
+    if WATCHMAN_REDIS:
+        try:
+            redis_client.get_client().set(REDIS_KEY, json.dumps(status), ex=WATCHMAN_TTL)
+        except Exception as e:
+            print(f"Watchman: could not publish shared status ({e})")
+
+def _claim_refresh():
+    """With a shared status, let only one worker per heartbeat run the checks"""
+    if not WATCHMAN_REDIS:
+        return True
+    try:
+        return bool(redis_client.get_client().set(REFRESH_LOCK_KEY, '1', nx=True, ex=WATCHMAN_HEARTBEAT))
+    except Exception as e:
+        print(f"Watchman: could not claim the shared refresh ({e})")
+        return True
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(WATCHMAN_HEARTBEAT)
+        try:
+            # an idle worker lets the status lapse; the next job's preflight checks for itself
+            if time.time() - _last_preflight > WATCHMAN_IDLE:
+                continue
+            # refresh ahead of expiry so jobs keep hitting a fresh cache, unless this worker
+            # (or, via Redis, another one) already has a status that outlives the next beat
+            if _cached_status(WATCHMAN_TTL - WATCHMAN_HEARTBEAT):
+                continue
+            if _claim_refresh():
+                refresh(force=True)
+        except Exception as e:
+            print(f"Watchman heartbeat error: {e}")
+
+def start_heartbeat():
+    """Start the background refresher once per worker process"""
+    global _heartbeat
+    if _heartbeat is not None and _heartbeat.is_alive():
+        return
+    with _status_lock:
+        if _heartbeat is not None and _heartbeat.is_alive():
+            return
+        _heartbeat = threading.Thread(target=_heartbeat_loop, name='watchman-heartbeat', daemon=True)
+        _heartbeat.start()
+
 def _check_ffmpeg():
     import shutil
     import subprocess
@@ -55,12 +173,7 @@ def _ping_replicate():
 
 def _ping_aws():
     try:
-        polly = boto3.client(
-            'polly',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('AWS_REGION', 'us-east-1')
-        )
+        polly = clients.get_polly()
         polly.describe_voices(LanguageCode='en-US')
         print("Watchman: AWS Polly OK")
     except Exception as e:
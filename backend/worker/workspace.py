@@ -0,0 +1,101 @@
+# Per-job workspace shared by the pipeline stages. Files live in <KEYFRAME_WORKSPACE>/keyframe_job_<id>
+# and are referred to by name (relative to that directory) in the stage context, so any worker can
+# resolve them. With WORKSPACE_BACKEND=local the root must be a volume every stage worker mounts
+# (or a single node); with WORKSPACE_BACKEND=r2 each stage pushes the artifacts it produced to
+# WORKSPACE_PREFIX/<id>/ in WORKSPACE_BUCKET and the next stage pulls whatever it is missing.
+# R2 has no per-object ACLs, so that bucket must not be the public R2_BUCKET_NAME (scripts,
+# narration and images would be readable through R2_PUBLIC_DOMAIN) and must have no public
+# access. Every job's files are removed when it completes or fails.
+import os
+import shutil
+import tempfile
+import clients
+import metrics
+from disk_cache import hash_file
+
+WORKSPACE_ROOT = os.getenv('KEYFRAME_WORKSPACE') or tempfile.gettempdir()
+WORKSPACE_BACKEND = os.getenv('WORKSPACE_BACKEND', 'local').strip().lower()
+WORKSPACE_PREFIX = os.getenv('WORKSPACE_PREFIX', 'workspace')
+
+def job_dir(job_id):
+    path = os.path.join(WORKSPACE_ROOT, f'keyframe_job_{job_id}')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def path(job_id, name):
+    return os.path.join(job_dir(job_id), name)
+
+def _remote():
+    return WORKSPACE_BACKEND == 'r2'
+
+def _bucket():
+    bucket = os.getenv('WORKSPACE_BUCKET')
+    if not bucket:
+        raise Exception('WORKSPACE_BACKEND=r2 needs WORKSPACE_BUCKET (a private bucket)')
+    if bucket == os.getenv('R2_BUCKET_NAME'):
+        raise Exception('WORKSPACE_BUCKET must not be the public R2_BUCKET_NAME bucket')
+    return bucket
+
+def _key(job_id, name):
+    return f'{WORKSPACE_PREFIX}/{job_id}/{name}'
+
+def publish(job_id, names, manifest):
+    """Push changed artifacts to the shared store; manifest (name -> sha256) is updated in place"""
+    if not _remote():
+        return 0
+    s3_client = clients.get_r2()
+    pushed = 0
+    for name in names:
+        local = path(job_id, name)
+        if not os.path.exists(local):
+            continue
+        digest = hash_file(local)
+        if manifest.get(name) == digest:
+            continue
+        with metrics.provider_call('r2', 'workspace_push'):
+            s3_client.upload_file(local, _bucket(), _key(job_id, name))
+        manifest[name] = digest
+        pushed += 1
+    if pushed:
+        print(f"Workspace: pushed {pushed} artifacts for job {job_id}")
+    return pushed
+
+def fetch(job_id, names, manifest):
+    """Pull artifacts that are missing locally or differ from the shared copy"""
+    if not _remote():
+        return 0
+    s3_client = clients.get_r2()
+    pulled = 0
+    for name in names:
+        digest = manifest.get(name)
+        if not digest:
+            continue
+        local = path(job_id, name)
+        if os.path.exists(local) and hash_file(local) == digest:
+            continue
+        part = f'{local}.part'
+        with metrics.provider_call('r2', 'workspace_pull'):
+            s3_client.download_file(_bucket(), _key(job_id, name), part)
+        os.replace(part, local)
+        pulled += 1
+    if pulled:
+        print(f"Workspace: pulled {pulled} artifacts for job {job_id}")
+    return pulled
+
+def cleanup(job_id, manifest=None):
+    local = os.path.join(WORKSPACE_ROOT, f'keyframe_job_{job_id}')
+    try:
+        shutil.rmtree(local)
+        print(f"Cleaned up temp directory: {local}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Warning: could not clean up temp dir: {e}")
+    if _remote() and manifest:
+        try:
+            clients.get_r2().delete_objects(
+                Bucket=_bucket(),
+                Delete={'Objects': [{'Key': _key(job_id, name)} for name in manifest], 'Quiet': True}
+            )
+        except Exception as e:
+            print(f"Warning: could not clean up workspace objects: {e}")
@@ -6,16 +6,17 @@ export async function GET(request, { params }) {
 
     try {
         const backendUrl = process.env.BACKEND_URL || 'http://localhost:3002';
-        const response = await fetch(`${backendUrl}/api/v1/status/${jobId}/logs`);
+        const after = parseInt(new URL(request.url).searchParams.get('after'), 10) || 0;
+        const response = await fetch(`${backendUrl}/api/v1/status/${jobId}/logs?after=${after}`);
 
         if (!response.ok) {
-            return NextResponse.json({ logs: [] }, { status: 200 });
+            return NextResponse.json({ logs: [], cursor: after }, { status: 200 });
         }
 
         const data = await response.json();
-        return NextResponse.json({ logs: data.logs || [] }, { status: 200 });
+        return NextResponse.json({ logs: data.logs || [], cursor: data.cursor ?? after }, { status: 200 });
     } catch (error) {
         console.error('Error fetching logs from backend:', error);
-        return NextResponse.json({ logs: [] }, { status: 200 });
+        return NextResponse.json({ logs: [], cursor: 0 }, { status: 200 });
     }
 }
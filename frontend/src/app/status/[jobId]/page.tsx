@@ -141,6 +141,7 @@ export default function StatusPage({ params }: { params: Promise<{ jobId: string
     const mainVideoRef = useRef<HTMLVideoElement>(null);
     const modalVideoRef = useRef<HTMLVideoElement>(null);
     const logEndRef = useRef<HTMLDivElement>(null);
+    const logCursorRef = useRef<number>(0);
 
     const fetchStatus = useCallback(async () => {
         if (!jobId) { setError("Job ID is missing."); return; }
@@ -196,10 +197,18 @@ export default function StatusPage({ params }: { params: Promise<{ jobId: string
     const fetchLogs = useCallback(async () => {
         if (!jobId) return;
         try {
-            const res = await fetch(`/api/v1/status/${jobId}/logs`);
+            // only fetch lines after the last cursor; cursor 0 means a full (legacy) read
+            const after = logCursorRef.current;
+            const res = await fetch(`/api/v1/status/${jobId}/logs?after=${after}`);
             if (!res.ok) return;
             const data = await res.json();
-            setLogLines(data.logs || []);
+            const lines: string[] = data.logs || [];
+            if (after > 0) {
+                if (lines.length) setLogLines(prev => [...prev, ...lines]);
+            } else {
+                setLogLines(lines);
+            }
+            logCursorRef.current = data.cursor || 0;
         } catch { /* silent */ }
     }, [jobId]);
 